@@ -0,0 +1,16 @@
+-- Indexes for ban lookups and log queries.
+-- find_ban already searches ip_bans and hdid_bans through their primary
+-- keys; these indexes cover the lookups in the other direction, from a
+-- ban to the IPIDs and HDIDs it affects.
+CREATE INDEX IF NOT EXISTS ip_bans_ban_id ON ip_bans(ban_id, ipid);
+CREATE INDEX IF NOT EXISTS hdid_bans_ban_id ON hdid_bans(ban_id, hdid);
+
+-- Pending timed bans, ordered by the time they expire (schedule_unbans)
+CREATE INDEX IF NOT EXISTS bans_pending_unban ON bans(datetime(unban_date))
+	WHERE unban_date IS NOT NULL AND unbanned = 0;
+
+-- Last known OOC name of an IPID (last_known_name)
+CREATE INDEX IF NOT EXISTS room_events_ipid_time
+	ON room_events(ipid, event_time, ooc_name);
+
+PRAGMA user_version = 7;
@@ -0,0 +1,105 @@
+"""
+Benchmark for reading the YAML config files at startup.
+Writes a config folder with a large character list and music list to a
+temporary directory, and times reading every YAML file that the server
+reads at startup in three ways:
+
+    safe_load   yaml.safe_load, as the server used to
+    cold        server.config_loader.load_yaml with an empty cache
+    warm        server.config_loader.load_yaml with the cache of the
+                cold run, as on a restart with unchanged config
+
+Run from the root of the repository:
+
+    python scripts/bench_config.py [-c 2000] [-t 20000] [-n 5]
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from server import config_loader
+from server.config_loader import load_yaml
+
+CONFIG_FILES = ['config.yaml', 'areas.yaml', 'iniswaps.yaml', 'characters.yaml',
+                'music.yaml', 'backgrounds.yaml']
+
+
+def make_config(config_dir, characters, tracks, per_category=100):
+    sample_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'config_sample')
+    for name in CONFIG_FILES:
+        shutil.copy(os.path.join(sample_dir, name), config_dir)
+    with open(os.path.join(config_dir, 'characters.yaml'), 'w') as file:
+        yaml.safe_dump([f'Character {i}' for i in range(characters)], file)
+    music_list = [{'use_unique_folder': False}]
+    for i in range(0, tracks, per_category):
+        music_list.append({
+            'category': f'=={i // per_category}==',
+            'songs': [{'name': f'Track {j}.opus', 'length': j % 300}
+                      for j in range(i, min(i + per_category, tracks))]
+        })
+    with open(os.path.join(config_dir, 'music.yaml'), 'w') as file:
+        yaml.safe_dump(music_list, file)
+
+
+def pure_load(path):
+    with open(path, 'rb') as file:
+        return yaml.safe_load(file)
+
+
+def time_load(load, config_dir, runs, before_run=None):
+    best = None
+    for _ in range(runs):
+        if before_run is not None:
+            before_run()
+        start = time.perf_counter()
+        for name in CONFIG_FILES:
+            load(os.path.join(config_dir, name))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-c', '--characters', type=int, default=2000, help='number of characters')
+    parser.add_argument('-t', '--tracks', type=int, default=20000, help='number of music tracks')
+    parser.add_argument('-n', '--runs', type=int, default=5, help='runs of each method, the best is kept')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config_dir = os.path.join(tmp_dir, 'config')
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        os.mkdir(config_dir)
+        make_config(config_dir, args.characters, args.tracks)
+
+        def clear_cache():
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+        for name in CONFIG_FILES:
+            path = os.path.join(config_dir, name)
+            assert load_yaml(path, None) == pure_load(path)
+
+        print(f'{args.characters} characters, {args.tracks} tracks '
+              f'(loader: {config_loader.SafeLoader.__name__}):')
+        results = [
+            ('safe_load', time_load(pure_load, config_dir, args.runs)),
+            ('cold', time_load(lambda path: load_yaml(path, cache_dir),
+                               config_dir, args.runs, clear_cache)),
+            ('warm', time_load(lambda path: load_yaml(path, cache_dir),
+                               config_dir, args.runs))
+        ]
+        for name, elapsed in results:
+            print(f'  {name:<10} {elapsed * 1000:10.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
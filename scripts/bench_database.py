@@ -0,0 +1,82 @@
+"""
+Benchmark for inserting IC log events into the database.
+Inserts rows into ic_events under each database profile, both with a
+commit per event (as the server used to log) and through the
+write-behind event log. Each run uses a fresh database in a temporary
+directory. Run from the root of the repository:
+
+    python scripts/bench_database.py [-n 100000] [--profiles legacy tuned]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from server import database
+from server.database import Database
+
+
+def make_database(tmp, profile):
+    os.chdir(tmp)
+    os.mkdir('storage')
+    os.symlink(os.path.join(ROOT, 'migrations'), 'migrations')
+    return Database(profile=profile, log_flush_interval=0.05)
+
+
+def per_event_commit(db, count, client, room):
+    for i in range(count):
+        with db.db as conn:
+            conn.execute(database.SQL_LOG_IC, (db._event_time(), client.ipid,
+                room.abbreviation, client.char_name, 'Nick', f'message {i}'))
+
+
+def write_behind(db, count, client, room):
+    for i in range(count):
+        db.log_writer.put(database.SQL_LOG_IC, (db._event_time(), client.ipid,
+            room.abbreviation, client.char_name, 'Nick', f'message {i}'))
+    db.log_writer.flush()
+
+
+def run(profile, method, count):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            db = make_database(tmp, profile)
+            client = SimpleNamespace(ipid=db.ipid('127.0.0.1'),
+                                     char_name='Phoenix')
+            room = SimpleNamespace(abbreviation='LOB')
+            start = time.perf_counter()
+            method(db, count, client, room)
+            elapsed = time.perf_counter() - start
+            rows = db.db.execute('SELECT COUNT(*) FROM ic_events').fetchone()[0]
+            assert rows == count
+            db.close()
+        finally:
+            os.chdir(cwd)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=100000, help='number of rows to insert')
+    parser.add_argument('--profiles', nargs='+', default=list(database.PROFILES),
+                        choices=list(database.PROFILES), help='database profiles to compare')
+    args = parser.parse_args()
+
+    print(f'{args.count} ic_events rows:')
+    for profile in args.profiles:
+        for label, method in (('commit per event', per_event_commit),
+                              ('write-behind', write_behind)):
+            elapsed = run(profile, method, args.count)
+            print(f'  {profile:<8} {label:<18} {elapsed * 1000:10.2f} ms'
+                  f' ({args.count / elapsed:10.0f} rows/s)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Memory benchmark for the emote tables used to validate INI swaps.
+Loads the emotes of every character in the characters directory, as
+many times as needed to reach the requested number of characters, and
+measures the memory held by the tables with tracemalloc. The tables are
+compared with the sets of (preanim, anim, sfx) tuples that Emotes used
+to keep. Run from the root of the repository:
+
+    python scripts/bench_emotes.py [-c 900] [-n 100000]
+"""
+
+import argparse
+import gc
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from server.emotes import EmoteAtoms, Emotes
+
+
+class LegacyEmotes(Emotes):
+    """The tuple sets that Emotes kept before it stored emote IDs."""
+
+    def __init__(self, name):
+        self.CHAR_DIR = 'characters'
+        self.name = name
+        self.legacy_emotes = set()
+        char_ini = self._read_ini()
+        if char_ini is None or not self._is_valid_emotions_section(char_ini['Emotions']):
+            return
+        for emote_id in range(1, char_ini['Emotions'].getint('number') + 1):
+            emote_id = str(emote_id)
+            emotion_information = char_ini['Emotions'].get(emote_id)
+            if emotion_information is not None:
+                _name, preanim, anim, _mod = emotion_information.split('#')[:4]
+                sfx = self._get_sfx(emote_id, char_ini)
+                self.legacy_emotes.add((preanim, anim, sfx))
+                self.legacy_emotes.add((preanim, anim, None))
+
+    def validate(self, preanim, anim, sfx):
+        if len(self.legacy_emotes) == 0:
+            return True
+        if sfx is not None and len(sfx) <= 1:
+            sfx = None
+        return (preanim, anim, sfx) in self.legacy_emotes
+
+
+def measure(cls, names):
+    gc.collect()
+    tracemalloc.start()
+    tables = [cls(name) for name in names]
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return tables, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-c', '--characters', type=int, default=900, help='number of characters to load')
+    parser.add_argument('-n', '--checks', type=int, default=100000, help='number of emotes to validate')
+    args = parser.parse_args()
+
+    names = sorted(os.listdir('characters'))
+    names = (names * (args.characters // len(names) + 1))[:args.characters]
+
+    legacy, legacy_size = measure(LegacyEmotes, names)
+    atoms = EmoteAtoms()
+    compact, compact_size = measure(lambda name: Emotes(name, atoms=atoms), names)
+    emotes = sum(len(table.legacy_emotes) for table in legacy)
+
+    random.seed(0)
+    checks = []
+    for _ in range(args.checks):
+        i = random.randrange(len(names))
+        emote = random.choice(sorted(legacy[i].legacy_emotes, key=str) or [('a', 'b', None)])
+        if random.random() < 0.3:
+            emote = (emote[0], emote[1] + 'x', emote[2])
+        checks.append((i, emote))
+    for i, emote in checks[:1000]:
+        assert legacy[i].validate(*emote) == compact[i].validate(*emote)
+
+    print(f'{len(names)} characters, {emotes} emote tuples:')
+    for label, tables, size in (('tuples', legacy, legacy_size),
+                                ('IDs', compact, compact_size)):
+        start = time.perf_counter()
+        for i, emote in checks:
+            tables[i].validate(*emote)
+        elapsed = time.perf_counter() - start
+        print(f'  {label:<7} {size / 1024:10.1f} KiB'
+              f'   validate {elapsed / len(checks) * 1e9:6.0f} ns')
+
+
+if __name__ == '__main__':
+    main()
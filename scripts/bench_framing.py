@@ -0,0 +1,72 @@
+"""
+Microbenchmark for the AO packet framer.
+Feeds pipelined packets through the old string-based parser and through
+AOFramer, both as a single segment and split into small TCP-sized chunks.
+Run from the root of the repository:
+
+    python scripts/bench_framing.py [-n 10000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from server.network.framing import AOFramer
+
+
+class OldFramer:
+    """The parser AOProtocol used before AOFramer, kept for comparison."""
+    def __init__(self):
+        self.buffer = ''
+
+    def feed(self, data):
+        self.buffer += data.decode('utf-8', 'ignore')
+        self.buffer = self.buffer.translate({ord(c): None for c in '\0'})
+
+    def pop_messages(self):
+        messages = []
+        while '#%' in self.buffer:
+            spl = self.buffer.split('#%', 1)
+            self.buffer = spl[1]
+            messages.append(spl[0])
+        return messages
+
+
+def make_stream(count):
+    packet = 'MS#chat#-#Phoenix#normal#Hold it! ü#def#1#0#0#0#0#0#0#0#0#Nick#-1#0#0#%'
+    return (packet * count).encode('utf-8')
+
+
+def run(framer_cls, stream, chunk_size):
+    framer = framer_cls()
+    total = 0
+    start = time.perf_counter()
+    if chunk_size is None:
+        framer.feed(stream)
+        total += len(framer.pop_messages())
+    else:
+        for i in range(0, len(stream), chunk_size):
+            framer.feed(stream[i:i + chunk_size])
+            total += len(framer.pop_messages())
+    return time.perf_counter() - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=10000, help='number of pipelined packets')
+    args = parser.parse_args()
+
+    stream = make_stream(args.count)
+    for label, chunk_size in (('one segment', None), ('1460-byte segments', 1460)):
+        print(f'{args.count} packets, {label}:')
+        for name, framer_cls in (('old', OldFramer), ('AOFramer', AOFramer)):
+            elapsed, total = run(framer_cls, stream, chunk_size)
+            assert total == args.count
+            print(f'  {name:<10} {elapsed * 1000:10.2f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark for the music lookups done for every MC packet.
+Builds a music list with many tracks and resolves random track and
+category names with TsuServer3.get_song_is_category and get_song_data,
+comparing the name index with the scan over the whole list that they
+used to do. Run from the root of the repository:
+
+    python scripts/bench_music.py [-t 10000] [-n 20000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from server.exceptions import ServerError
+from server.tsuserver import TsuServer3
+
+
+def make_music_list(tracks, per_category=100):
+    music_list = [{'use_unique_folder': False}]
+    for i in range(0, tracks, per_category):
+        music_list.append({
+            'category': f'=={i // per_category}==',
+            'songs': [{'name': f'Track {j}.opus', 'length': j % 300}
+                      for j in range(i, min(i + per_category, tracks))]
+        })
+    return music_list
+
+
+def old_handle_mc(music_list, music):
+    """The lookups an MC packet did before the music list was indexed."""
+    for item in music_list:
+        if 'category' not in item:
+            continue
+        if item['category'] == music:
+            return '~stop.mp3', 0
+    for item in music_list:
+        if 'category' not in item:
+            continue
+        if item['category'] == music:
+            return item['category'], -1
+        for song in item['songs']:
+            if song['name'] == music:
+                return song['name'], song.get('length', -1)
+    raise ServerError('Music not found.')
+
+
+def new_handle_mc(server, music):
+    if server.get_song_is_category(server.music_list, music):
+        return '~stop.mp3', 0
+    return server.get_song_data(server.music_list, music)
+
+
+def run(handle, names):
+    for name in names:
+        try:
+            handle(name)
+        except ServerError:
+            pass
+
+
+def outcome(handle, name):
+    try:
+        return handle(name)
+    except ServerError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-t', '--tracks', type=int, default=10000, help='number of tracks in the music list')
+    parser.add_argument('-n', '--packets', type=int, default=20000, help='number of MC packets')
+    args = parser.parse_args()
+
+    # Only the music attributes of the server are used
+    server = TsuServer3.__new__(TsuServer3)
+    server.music_list = make_music_list(args.tracks)
+    server.music_index = server.build_music_index(server.music_list)
+
+    random.seed(0)
+    names = [f'Track {random.randrange(args.tracks)}.opus' for _ in range(args.packets)]
+    names[::10] = [f'=={i % (args.tracks // 100 or 1)}==' for i in range(len(names[::10]))]
+    names[5::20] = ['Unknown.opus'] * len(names[5::20])
+    handlers = (('scan', lambda name: old_handle_mc(server.music_list, name)),
+                ('index', lambda name: new_handle_mc(server, name)))
+    for name in names[:100]:
+        assert outcome(handlers[0][1], name) == outcome(handlers[1][1], name)
+
+    print(f'{args.tracks} tracks, {args.packets} MC packets:')
+    for label, handle in handlers:
+        start = time.perf_counter()
+        run(handle, names)
+        elapsed = time.perf_counter() - start
+        print(f'  {label:<6} {args.packets / elapsed:12.0f} packets/s'
+              f'   {elapsed / args.packets * 1e6:8.2f} us/packet')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark for ClientManager.get_targets.
+Connects simulated clients to a ClientManager and resolves targets by
+OOC name, character name and IP, comparing the prefix indexes with the
+scan over every client that get_targets used to do. Run from the root
+of the repository:
+
+    python scripts/bench_targets.py [-c 2000] [-n 2000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from server.client_manager import ClientManager
+from server.constants import TargetType
+
+
+class FakeArea:
+    def __init__(self):
+        self.clients = set()
+        self.afkers = []
+        self.owners = []
+        self.jukebox = False
+
+    def change_client_char(self, client, old_char_id, new_char_id):
+        pass
+
+
+def make_manager(count):
+    area = FakeArea()
+    floodguard = {'times_per_interval': 1, 'interval_length': 0, 'mute_length': 0}
+    server = SimpleNamespace(
+        char_list=[f'Character{i}' for i in range(500)],
+        config={'playerlimit': count, 'multiclient_limit': 16,
+                'music_change_floodguard': floodguard,
+                'wtce_floodguard': floodguard},
+        area_manager=SimpleNamespace(default_area=lambda: area, areas=[area],
+                                     get_owned_areas=lambda client: []))
+    manager = server.client_manager = ClientManager(server)
+    for i in range(count):
+        client = manager.new_client(None, 100000 + i)
+        area.clients.add(client)
+        client.name = f'Player{i}'
+        client.char_id = i % len(server.char_list)
+    return manager
+
+
+def old_get_targets(client, key, value):
+    """The scan that get_targets did before it used prefix indexes."""
+    targets = []
+    for area in client.server.area_manager.areas:
+        for client in area.clients:
+            if key == TargetType.IP:
+                if value.lower().startswith(str(client.ip).lower()):
+                    targets.append(client)
+            elif key == TargetType.OOC_NAME:
+                if value.lower().startswith(
+                        client.name.lower()) and client.name:
+                    targets.append(client)
+            elif key == TargetType.CHAR_NAME:
+                if value.lower().startswith(
+                        client.char_name.lower()):
+                    targets.append(client)
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-c', '--clients', type=int, default=2000, help='number of simulated clients')
+    parser.add_argument('-n', '--lookups', type=int, default=2000, help='number of lookups per key')
+    args = parser.parse_args()
+
+    manager = make_manager(args.clients)
+    clients = list(manager.clients)
+    random.seed(0)
+    sample = [random.choice(clients) for _ in range(args.lookups)]
+    queries = {
+        TargetType.OOC_NAME: [f'{c.name} stop spamming' for c in sample],
+        TargetType.CHAR_NAME: [f'{c.char_name} hello' for c in sample],
+        TargetType.IP: [str(c.ip) for c in sample]
+    }
+
+    print(f'{args.clients} clients, {args.lookups} lookups per key:')
+    for key, values in queries.items():
+        caller = sample[0]
+        for value in values[:20]:
+            assert set(manager.get_targets(caller, key, value)) == \
+                set(old_get_targets(caller, key, value))
+
+        start = time.perf_counter()
+        for value in values:
+            old_get_targets(caller, key, value)
+        old = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for value in values:
+            manager.get_targets(caller, key, value)
+        new = time.perf_counter() - start
+
+        print(f'  {key.name:<10} scan {old / len(values) * 1e6:10.1f} us'
+              f'   index {new / len(values) * 1e6:8.1f} us')
+
+
+if __name__ == '__main__':
+    main()
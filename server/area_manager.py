@@ -19,13 +19,13 @@ import asyncio
 import random
 import time
 import arrow
-import yaml
 
 from dataclasses import dataclass
 from enum import Enum
 from typing import List
 
 from server import database
+from server.config_loader import load_yaml
 from server.exceptions import AreaError
 from server.evidence import EvidenceList
 from server.client_manager import ClientManager
@@ -59,6 +59,16 @@ class AreaManager:
                      non_int_pres_only=False):
             self.iniswap_allowed = iniswap_allowed
             self.clients = set()
+            # Clients grouped by protocol bucket (see ClientManager.Client.get_protocol_bucket)
+            self.protocol_buckets = {}
+            # Number of clients in the area using each character ID
+            self.char_counts = {}
+            # Cached CharsCheck arguments and packet, rebuilt when a
+            # character is taken or freed
+            self.chars_check = None
+            self.chars_check_packet = None
+            # Pending broadcast of the available characters
+            self.chars_check_flush = None
             self.invite_list = {}
             self.id = area_id
             self.name = name
@@ -116,6 +126,8 @@ class AreaManager:
         def new_client(self, client: ClientManager.Client):
             """Add a client to the area."""
             self.clients.add(client)
+            self.protocol_buckets.setdefault(client.protocol_bucket, set()).add(client)
+            self._take_char(client.char_id)
             self.server.area_manager.send_arup_players()
             if client.char_id != -1:
                 database.log_room('area.join', client, self)
@@ -164,15 +176,33 @@ class AreaManager:
             """
 
             self.clients.remove(client)
+            self._remove_from_protocol_bucket(client, client.protocol_bucket)
+            self._release_char(client.char_id)
+            self.server.area_manager.send_arup_players()
             if client in self.afkers:
                 self.afkers.remove(client)
             if len(self.clients) == 0:
                 self.change_status('IDLE')
                 self.unlock()
-                client.area.owners = []
+                self.clear_owners()
             if client.char_id != -1:
                 database.log_room('area.leave', client, self)
 
+        def _remove_from_protocol_bucket(self, client: ClientManager.Client, bucket):
+            bucket_clients = self.protocol_buckets[bucket]
+            bucket_clients.discard(client)
+            if len(bucket_clients) == 0:
+                del self.protocol_buckets[bucket]
+
+        def move_protocol_bucket(self, client: ClientManager.Client, old_bucket):
+            """Move a client that changed versions to its new protocol bucket.
+            Args:
+                client (ClientManager.Client): client whose version changed
+                old_bucket: protocol bucket the client used to belong to
+            """
+            self._remove_from_protocol_bucket(client, old_bucket)
+            self.protocol_buckets.setdefault(client.protocol_bucket, set()).add(client)
+
         def client_can_additive(self, client: ClientManager.Client):
             if self.last_ic_message is None:
                 return False
@@ -182,6 +212,36 @@ class AreaManager:
                 return True
             return False
 
+        def add_owner(self, client: ClientManager.Client):
+            """Make a client a CM of the area.
+            Args:
+                client (ClientManager.Client): New CM
+            """
+
+            if client in self.owners:
+                return
+            self.owners.append(client)
+            self.server.area_manager.owned_areas.setdefault(client, set()).add(self)
+
+        def remove_owner(self, client: ClientManager.Client):
+            """Remove a client from the CMs of the area.
+            Args:
+                client (ClientManager.Client): CM to remove
+            """
+
+            if client not in self.owners:
+                return
+            self.owners.remove(client)
+            owned_areas = self.server.area_manager.owned_areas
+            owned_areas[client].discard(self)
+            if not owned_areas[client]:
+                del owned_areas[client]
+
+        def clear_owners(self):
+            """Remove all CMs of the area."""
+            for client in list(self.owners):
+                self.remove_owner(client)
+
         def unlock(self):
             """Mark the area as unlocked."""
             self.is_locked = self.Locked.FREE
@@ -218,16 +278,89 @@ class AreaManager:
                 bool: True if the character is available. False if not available
             """
 
-            return char_id not in [x.char_id for x in self.clients]
+            return char_id not in self.char_counts
 
         def get_rand_avail_char_id(self):
             """Get a random available character ID."""
-            avail_set = set(range(len(
-                self.server.char_list))) - {x.char_id
-                                            for x in self.clients}
-            if len(avail_set) == 0:
+            char_count = len(self.server.char_list)
+            taken = sum(1 for char_id in self.char_counts
+                        if 0 <= char_id < char_count)
+            if taken >= char_count:
                 raise AreaError('No available characters.')
-            return random.choice(tuple(avail_set))
+            if taken * 2 > char_count:
+                return random.choice([char_id for char_id in range(char_count)
+                                      if char_id not in self.char_counts])
+            # At least half of the characters are free, so this takes
+            # two tries on average.
+            while True:
+                char_id = random.randrange(char_count)
+                if char_id not in self.char_counts:
+                    return char_id
+
+        def _take_char(self, char_id: int):
+            count = self.char_counts.get(char_id, 0)
+            self.char_counts[char_id] = count + 1
+            if count == 0:
+                self._chars_changed(char_id)
+
+        def _release_char(self, char_id: int):
+            count = self.char_counts[char_id]
+            if count == 1:
+                del self.char_counts[char_id]
+                self._chars_changed(char_id)
+            else:
+                self.char_counts[char_id] = count - 1
+
+        def _chars_changed(self, char_id: int):
+            # Spectators do not take up a character
+            if 0 <= char_id < len(self.server.char_list):
+                self.chars_check = None
+                self.send_chars_check()
+
+        def change_client_char(self, client: ClientManager.Client,
+                               old_char_id: int, new_char_id: int):
+            """Update the characters in use after a client in the area
+            changed characters.
+            Args:
+                client (ClientManager.Client): client that changed characters
+                old_char_id (int): previous character ID
+                new_char_id (int): new character ID
+            """
+            if client not in self.clients:
+                return
+            self._release_char(old_char_id)
+            self._take_char(new_char_id)
+
+        def get_chars_check(self) -> tuple:
+            """Get the CharsCheck arguments of the area: -1 for each
+            taken character and 0 for each free one."""
+            char_count = len(self.server.char_list)
+            if self.chars_check is None or len(self.chars_check) != char_count:
+                chars_check = [0] * char_count
+                for char_id in self.char_counts:
+                    if 0 <= char_id < char_count:
+                        chars_check[char_id] = -1
+                self.chars_check = tuple(chars_check)
+                self.chars_check_packet = ClientManager.Client.encode_command(
+                    'CharsCheck', *self.chars_check)
+            return self.chars_check
+
+        def send_chars_check(self):
+            """Send the available characters to all clients in the area.
+            The broadcast is deferred to the end of the current event loop
+            iteration, so that any number of changes in the meantime are
+            sent only once."""
+            if self.chars_check_flush is None:
+                self.chars_check_flush = asyncio.get_event_loop().call_soon(
+                    self.flush_chars_check)
+
+        def flush_chars_check(self):
+            """Send a pending broadcast of the available characters."""
+            if self.chars_check_flush is not None:
+                self.chars_check_flush.cancel()
+                self.chars_check_flush = None
+            for client in self.clients:
+                client.send_chars_check()
 
         def send_command(self, cmd: str, *args):
             """Broadcast an AO-compatible command to all clients in the area.
@@ -235,8 +368,9 @@ class AreaManager:
                 cmd (str): Command to send
             """
 
-            for c in self.clients:
-                c.send_command(cmd, *args)
+            client_manager = self.server.client_manager
+            for bucket, clients in self.protocol_buckets.items():
+                client_manager.broadcast_to_bucket(bucket, clients, cmd, *args)
 
         def send_owner_command(self, cmd: str, *args):
             """Send an AO-compatible command to all owners of the area
@@ -244,9 +378,8 @@ class AreaManager:
             Args:
                 cmd (str): Command to send
             """
-            for c in self.owners:
-                if c not in self.clients:
-                    c.send_command(cmd, *args)
+            self.server.client_manager.broadcast_command(
+                [c for c in self.owners if c not in self.clients], cmd, *args)
 
         def broadcast_ooc(self, msg: str):
             """Broadcast an OOC message to all clients in the area.
@@ -802,17 +935,34 @@ class AreaManager:
                 self.chance = 1
                 self.showname = showname
 
+    ARUP_PLAYERS = 0
+    ARUP_STATUS = 1
+    ARUP_CMS = 2
+    ARUP_LOCK = 3
+    ARUP_TYPES = (ARUP_PLAYERS, ARUP_STATUS, ARUP_CMS, ARUP_LOCK)
+
     def __init__(self, server):
         self.server = server
         self.cur_id = 0
         self.areas = []
+        self.areas_by_id = {}
+        self.areas_by_name = {}
+        # Encoded FA packet with the names of all areas
+        self.area_list_packet = None
+        # Areas owned by each CM
+        self.owned_areas = {}
+        # ARUP types changed since the last broadcast
+        self.arup_dirty = set()
+        # Arguments of the last ARUP broadcast of each type
+        self.arup_sent = {}
+        # Pending ARUP broadcast
+        self.arup_flush = None
         self.load_areas()
         self.timer = AreaManager.Timer()
 
     def load_areas(self):
         """Create all areas from a YAML file."""
-        with open('config/areas.yaml', 'r') as chars:
-            areas = yaml.safe_load(chars)
+        areas = load_yaml('config/areas.yaml')
         for item in areas:
             if 'evidence_mod' not in item:
                 item['evidence_mod'] = 'FFA'
@@ -840,6 +990,11 @@ class AreaManager:
                           item['shouts_allowed'], item['jukebox'],
                           item['abbreviation'], item['noninterrupting_pres']))
             self.cur_id += 1
+        for area in self.areas:
+            self.areas_by_id[area.id] = area
+            self.areas_by_name.setdefault(area.name, area)
+        self.area_list_packet = ClientManager.Client.encode_command(
+            'FA', *[area.name for area in self.areas])
 
     def default_area(self):
         """Get the default area."""
@@ -855,10 +1010,10 @@ class AreaManager:
             Area: The Area
         """
 
-        for area in self.areas:
-            if area.name == name:
-                return area
-        raise AreaError('Area not found.')
+        try:
+            return self.areas_by_name[name]
+        except KeyError:
+            raise AreaError('Area not found.')
 
     def get_area_by_id(self, area_id: int) -> Area:
         """Get an area by ID
@@ -870,10 +1025,20 @@ class AreaManager:
             Area: The Area
         """
 
-        for area in self.areas:
-            if area.id == area_id:
-                return area
-        raise AreaError('Area not found.')
+        try:
+            return self.areas_by_id[area_id]
+        except KeyError:
+            raise AreaError('Area not found.')
+
+    def get_owned_areas(self, client: ClientManager.Client) -> List[Area]:
+        """Get the areas a client is a CM of.
+        Args:
+            client (ClientManager.Client): The CM
+        Returns:
+            List[Area]: The areas, ordered by ID
+        """
+
+        return sorted(self.owned_areas.get(client, ()), key=lambda area: area.id)
 
     def abbreviate(self, name: str) -> str:
         """Abbreviate the name of a room.
@@ -903,38 +1068,101 @@ class AreaManager:
         """
 
         for a_id in area_ids:
-            self.get_area_by_id(a_id).send_command(cmd, *args)
-            self.get_area_by_id(a_id).send_owner_command(cmd, *args)
+            area = self.get_area_by_id(a_id)
+            area.send_command(cmd, *args)
+            area.send_owner_command(cmd, *args)
+
+    def get_arup(self, arup_type: int) -> list:
+        """Build the arguments of an ARUP packet.
+        Args:
+            arup_type (int): 0 for player counts, 1 for statuses,
+                2 for CMs, 3 for lock statuses
+        Returns:
+            list: ARUP arguments, starting with the type
+        """
+
+        args = [arup_type]
+        for area in self.areas:
+            if arup_type == self.ARUP_PLAYERS:
+                args.append(len(area.clients))
+            elif arup_type == self.ARUP_STATUS:
+                args.append(area.status)
+            elif arup_type == self.ARUP_CMS:
+                cm = 'FREE'
+                if len(area.owners) > 0:
+                    cm = area.get_cms()
+                args.append(cm)
+            elif arup_type == self.ARUP_LOCK:
+                args.append(area.is_locked.name)
+        return args
+
+    def schedule_arup(self, arup_type: int):
+        """Mark an ARUP type as changed and schedule a broadcast.
+        Changes made within `arup_interval` seconds of each other are
+        sent in a single broadcast.
+        Args:
+            arup_type (int): ARUP type that changed
+        """
+
+        self.arup_dirty.add(arup_type)
+        if self.arup_flush is None:
+            loop = asyncio.get_event_loop()
+            interval = self.server.config['arup_interval']
+            if interval > 0:
+                self.arup_flush = loop.call_later(interval, self.flush_arup)
+            else:
+                self.arup_flush = loop.call_soon(self.flush_arup)
+
+    def flush_arup(self):
+        """Broadcast the ARUP types that changed, skipping those whose
+        packet is the same as the one last broadcast."""
+        if self.arup_flush is not None:
+            self.arup_flush.cancel()
+            self.arup_flush = None
+        dirty = sorted(self.arup_dirty)
+        self.arup_dirty.clear()
+        for arup_type in dirty:
+            args = self.get_arup(arup_type)
+            if args == self.arup_sent.get(arup_type):
+                continue
+            self.arup_sent[arup_type] = args
+            self.server.send_arup(args)
+
+    def send_arup_snapshot(self, client: ClientManager.Client):
+        """Send every ARUP type to a single client.
+        Args:
+            client (ClientManager.Client): Client to send to
+        """
+
+        for arup_type in self.ARUP_TYPES:
+            args = self.get_arup(arup_type)
+            client.send_command('ARUP', *args)
+            if arup_type not in self.arup_sent:
+                if arup_type not in self.arup_dirty:
+                    # Nothing was broadcast yet, so every client was
+                    # sent this snapshot when it joined
+                    self.arup_sent[arup_type] = args
+            elif args != self.arup_sent[arup_type]:
+                # The client is ahead of everyone else; make sure the
+                # next broadcast is not skipped, even if the areas
+                # change back in the meantime.
+                del self.arup_sent[arup_type]
+                self.schedule_arup(arup_type)
 
     def send_arup_players(self):
         """Broadcast ARUP packet containing player counts."""
-        players_list = [0]
-        for area in self.areas:
-            players_list.append(len(area.clients))
-        self.server.send_arup(players_list)
+        self.schedule_arup(self.ARUP_PLAYERS)
 
     def send_arup_status(self):
         """Broadcast ARUP packet containing area statuses."""
-        status_list = [1]
-        for area in self.areas:
-            status_list.append(area.status)
-        self.server.send_arup(status_list)
+        self.schedule_arup(self.ARUP_STATUS)
 
     def send_arup_cms(self):
         """Broadcast ARUP packet containing area CMs."""
-        cms_list = [2]
-        for area in self.areas:
-            cm = 'FREE'
-            if len(area.owners) > 0:
-                cm = area.get_cms()
-            cms_list.append(cm)
-        self.server.send_arup(cms_list)
+        self.schedule_arup(self.ARUP_CMS)
 
     def send_arup_lock(self):
         """Broadcast ARUP packet containing the lock status of each area."""
-        lock_list = [3]
-        for area in self.areas:
-            lock_list.append(area.is_locked.name)
-        self.server.send_arup(lock_list)
+        self.schedule_arup(self.ARUP_LOCK)
         
     
@@ -0,0 +1,91 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+
+
+class LRUCache:
+    """A mapping that holds at most `max_size` entries, evicting the
+    least recently used entry first. Hits and misses are counted."""
+
+    _MISSING = object()
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Get the value of a key, marking it as recently used.
+
+        :param key: key to look up
+        :param default: value returned if the key is not cached
+        :returns: cached value or default
+
+        """
+        value = self.entries.get(key, self._MISSING)
+        if value is self._MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        """Cache a value, evicting the least recently used entry if the
+        cache is full.
+
+        :param key: key to cache
+        :param value: value of the key
+
+        """
+        if self.max_size <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove a key from the cache.
+
+        :param key: key to remove
+        :param default: value returned if the key is not cached
+        :returns: removed value or default
+
+        """
+        return self.entries.pop(key, default)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        self.entries.clear()
+
+    def stats(self):
+        """Get the size and hit/miss counters of the cache."""
+        return {
+            'size': len(self.entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
@@ -28,6 +28,7 @@ from heapq import heappop, heappush
 from server import database
 from server.constants import TargetType
 from server.exceptions import ClientError, AreaError
+from server.trie import PrefixTrie
 
 class ClientManager:
     """Holds the list of all clients currently connected to the server."""
@@ -40,15 +41,16 @@ class ClientManager:
         def __init__(self, server, transport: asyncio.Transport, user_id: int, ipid: int):
             self.is_checked = False
             self.transport = transport
-            self.hdid = ''
+            self._hdid = ''
             self.release = ''
             self.major_version = ''
             self.minor_version = ''
+            self.protocol_bucket = self.get_protocol_bucket('', '')
             self.id = user_id
-            self.char_id = -1
+            self._char_id = -1
             self.area = server.area_manager.default_area()
             self.server = server
-            self.name = ''
+            self._name = ''
             self.showname = ''
             self.fake_name = ''
             self.is_mod = False
@@ -104,7 +106,6 @@ class ClientManager:
                                ['times_per_interval'])
             ]
             # security stuff
-            self.clientscon = 0
             self.gm_save_time = 0
 
             # movement system stuff
@@ -122,6 +123,122 @@ class ClientManager:
             """
             self.transport.write(msg.encode('utf-8'))
 
+        @staticmethod
+        def encode_command(command: str, *args) -> bytes:
+            """Serialize an AO-compatible message, with arguments
+            delimited by `#` and ending with `#%`.
+
+            Args:
+                command (str): command name
+                *args: tuple containing the packet arguments
+
+            Returns:
+                bytes: the packet, ready to be written to a transport
+            """
+            if args:
+                return f'{command}#{"#".join([str(x) for x in args])}#%'.encode('utf-8')
+            return f'{command}#%'.encode('utf-8')
+
+        @staticmethod
+        def get_protocol_bucket(release: str, major_version: str) -> bool:
+            """Get the protocol capability group of a client version.
+            Clients in the same bucket are sent identical packets, save for
+            the evidence index remap.
+
+            Args:
+                release (str): release number of the client
+                major_version (str): major version number of the client
+
+            Returns:
+                bool: True if the client is too old (<2.9) to parse the Y
+                component of pairing offsets
+            """
+            return release == '2' and major_version in ('8', '7', '6')
+
+        def set_version(self, release: str, major_version='', minor_version=''):
+            """Set the client version, moving the client to another
+            protocol bucket in its area if needed.
+
+            Args:
+                release (str): release number
+                major_version (str, optional): major version number. Defaults to ''.
+                minor_version (str, optional): minor version number. Defaults to ''.
+            """
+            old_bucket = self.protocol_bucket
+            self.release = release
+            self.major_version = major_version
+            self.minor_version = minor_version
+            self.protocol_bucket = self.get_protocol_bucket(release, major_version)
+            if old_bucket != self.protocol_bucket and self in self.area.clients:
+                self.area.move_protocol_bucket(self, old_bucket)
+
+        @property
+        def evi_list(self) -> List[int]:
+            """Map of the evidence indices displayed to the client to
+            evidence indices in the area."""
+            return self._evi_list
+
+        @evi_list.setter
+        def evi_list(self, evi_list: List[int]):
+            self._evi_list = evi_list
+            # Reverse map, keeping the first occurrence of each index
+            self._evi_nums = {}
+            for evi_num, area_evi in enumerate(evi_list):
+                self._evi_nums.setdefault(area_evi, evi_num)
+
+        @staticmethod
+        def adapt_to_bucket(command: str, args: tuple, bucket: bool) -> tuple:
+            """Adapt the arguments of a command for a protocol bucket.
+
+            Args:
+                command (str): command name
+                args (tuple): packet arguments
+                bucket (bool): protocol bucket (see `get_protocol_bucket`)
+
+            Returns:
+                tuple: the adapted packet arguments
+            """
+            if command != 'MS' or not bucket or len(args) <= 20:
+                return args
+            lst = list(args) # convert to a list so we can modify it
+            # <2.9 can't parse Y offset so we strip it out based on version
+            lst[19] = str(lst[19]).split('<and>')[0] # MS arg 19 is self offset
+            lst[20] = str(lst[20]).split('<and>')[0] # MS arg 20 is paired offset
+            return tuple(lst)
+
+        def get_evidence_num(self, command: str, args: tuple):
+            """Get the index under which the evidence presented in an
+            IC message is displayed to the client.
+
+            Args:
+                command (str): command name
+                args (tuple): packet arguments
+
+            Returns:
+                int: evidence index, or None if the arguments are sent unchanged
+            """
+            if command != 'MS' or len(args) <= 11:
+                return None
+            try:
+                return self._evi_nums.get(args[11])
+            except TypeError: # unhashable argument
+                return None
+
+        @staticmethod
+        def remap_evidence(args: tuple, evi_num) -> tuple:
+            """Replace the evidence index of an IC message.
+
+            Args:
+                args (tuple): packet arguments
+                evi_num (int): index from `get_evidence_num`, or None
+
+            Returns:
+                tuple: the adapted packet arguments
+            """
+            if evi_num is None:
+                return args
+            return args[:11] + (evi_num,) + args[12:]
+
         def send_command(self, command: str, *args):
             """Compose and send an AO-compatible message, with arguments
             delimited by `#` and ending with `#%`.
@@ -130,27 +247,10 @@ class ClientManager:
                 command (str): command name
                 *args: tuple containing the packet arguments
             """
-            if args:
-                if command == 'MS':
-                    for evi_num in range(len(self.evi_list)):
-                        if self.evi_list[evi_num] == args[11]:
-                            lst = list(args) # convert to a list so we can modify it
-                            lst[11] = evi_num
-                            args = tuple(lst) # then convert back to a tuple when finished
-                            break
-                        # <2.9 can't parse Y offset so we strip it out based on version
-                        if self.release == '2' and self.major_version in ['8', '7', '6']:
-                            lst = list(args) 
-                            offset_pair_list = lst[19].split('<and>') # MS arg 19 is self offset
-                            lst[19] = offset_pair_list[0]
-                            other_offset_list = lst[20].split('<and>') # MS arg 20 is paired offset
-                            lst[20] = other_offset_list[0]
-                            args = tuple(lst)
-                            
-                self.send_raw_message(
-                    f'{command}#{"#".join([str(x) for x in args])}#%')
-            else:
-                self.send_raw_message(f'{command}#%')
+            args = self.adapt_to_bucket(command, args, self.protocol_bucket)
+            evi_num = self.get_evidence_num(command, args)
+            self.transport.write(self.encode_command(
+                command, *self.remap_evidence(args, evi_num)))
 
         def send_ooc(self, msg: str):
             """Send an out-of-character message to the client.
@@ -203,7 +303,7 @@ class ClientManager:
                 return False
             if not set(name_ws).issubset(printset):  # illegal chars in ooc name
                 return False
-            for client in self.server.client_manager.clients:
+            for client in self.server.client_manager.get_clients_by_name(name):
                 if client.name == name:
                     return False
             return True
@@ -243,8 +343,6 @@ class ClientManager:
             self.char_id = char_id
             self.pos = ''
             self.send_command('PV', self.id, 'CID', self.char_id)
-            self.area.send_command('CharsCheck',
-                                   *self.get_available_char_list())
 
             new_char = self.char_name
             database.log_room('char.change', self, self.area,
@@ -320,30 +418,24 @@ class ClientManager:
             Args:
                 music (List[Dict[str, str]], optional): List containing music information. Defaults to [].
             """
-            song_list = []
-
             if (len(music) > 0):
-                song_list = music
+                song_list = self.server.build_music_list_ao2(music)
+                # KEEP THE ASTERISK
+                self.send_command('FM', *song_list)
             else:
-                song_list = self.server.music_list
-
-            song_list = self.server.build_music_list_ao2(song_list)
-            # KEEP THE ASTERISK
-            self.send_command('FM', *song_list)
+                self.transport.write(self.server.music_list_ao2_packet)
 
         def reload_area_list(self, areas=[]):
-            """Reload the area list
+            """Reload the area list with the provided array, or the server area list as a whole.
 
             Args:
-                areas (List[AreaManager.Area], optional): List containing areas. Defaults to [].
+                areas (List[str], optional): List containing area names. Defaults to [].
             """
-            area_list = []
-
             if (len(areas) > 0):
-                area_list = areas
-
-            # KEEP THE ASTERISK
-            self.send_command('FA', *area_list)
+                # KEEP THE ASTERISK
+                self.send_command('FA', *areas)
+            else:
+                self.transport.write(self.server.area_manager.area_list_packet)
 
         def change_area(self, area):
             """Switch the client to another area, unless the area is locked.
@@ -389,10 +481,10 @@ class ClientManager:
 
             self.send_ooc(
                 f'Changed area to {area.name} [{self.area.status}].')
-            self.area.send_command('CharsCheck',
-                                   *self.get_available_char_list())
-            self.area.send_command(
-                'CharsCheck', *self.get_available_char_list())
+            # If the client took a character, the pending broadcast of the
+            # area already sends it the list of the new area.
+            if area.chars_check_flush is None:
+                self.send_chars_check()
             self.send_command('HP', 1, self.area.hp_def)
             self.send_command('HP', 2, self.area.hp_pro)
             self.send_command('BN', self.area.background, self.pos)
@@ -527,17 +619,14 @@ class ClientManager:
             This unconditionally causes the client to show the character
             selection screen, even if the client has already joined.
             """
-            self.send_command('CharsCheck', *self.get_available_char_list())
+            self.send_chars_check()
             self.send_command('HP', 1, self.area.hp_def)
             self.send_command('HP', 2, self.area.hp_pro)
             self.send_command('BN', self.area.background, self.pos)
             self.send_command('LE', *self.area.get_evidence_list(self))
             self.send_command('MM', 1)
 
-            self.server.area_manager.send_arup_players()
-            self.server.area_manager.send_arup_status()
-            self.server.area_manager.send_arup_cms()
-            self.server.area_manager.send_arup_lock()
+            self.server.area_manager.send_arup_snapshot(self)
 
             self.send_command('DONE')
 
@@ -548,19 +637,22 @@ class ClientManager:
 
         def get_available_char_list(self):
             """Get a list of character IDs that the client can select."""
-            if len(self.charcurse) > 0:
-                avail_char_ids = set(range(len(
-                    self.server.char_list))) and set(self.charcurse)
-            else:
-                avail_char_ids = set(range(len(self.server.char_list))) - {
-                    x.char_id
-                    for x in self.area.clients
-                }
+            if len(self.charcurse) == 0:
+                return list(self.area.get_chars_check())
             char_list = [-1] * len(self.server.char_list)
-            for x in avail_char_ids:
+            for x in self.charcurse:
                 char_list[x] = 0
             return char_list
 
+        def send_chars_check(self):
+            """Send the characters that the client can select."""
+            if len(self.charcurse) > 0:
+                self.send_command('CharsCheck',
+                                  *self.get_available_char_list())
+            else:
+                self.area.get_chars_check()
+                self.transport.write(self.area.chars_check_packet)
+
         def auth_mod(self, password: str) -> str:
             """Attempt to log in as a moderator.
 
@@ -592,6 +684,45 @@ class ClientManager:
             else:
                 raise ClientError('Invalid password.')
 
+        @property
+        def name(self) -> str:
+            """Get the OOC name of the client."""
+            return self._name
+
+        @name.setter
+        def name(self, name: str):
+            """Set the OOC name of the client, updating the name index."""
+            old_name = self._name
+            self._name = name
+            self.server.client_manager.reindex(self, 'name', old_name, name)
+
+        @property
+        def char_id(self) -> int:
+            """Get the ID of the character that the client is using."""
+            return self._char_id
+
+        @char_id.setter
+        def char_id(self, char_id: int):
+            """Set the character of the client, updating the character
+            name index."""
+            old_char_id = self._char_id
+            self._char_id = char_id
+            self.area.change_client_char(self, old_char_id, char_id)
+            self.server.client_manager.reindex(self, 'char_id', old_char_id,
+                                               char_id)
+
+        @property
+        def hdid(self) -> str:
+            """Get the hard drive ID of the client."""
+            return self._hdid
+
+        @hdid.setter
+        def hdid(self, hdid: str):
+            """Set the hard drive ID of the client, updating the HDID index."""
+            old_hdid = self._hdid
+            self._hdid = hdid
+            self.server.client_manager.reindex(self, 'hdid', old_hdid, hdid)
+
         @property
         def ip(self) -> int:
             """Get an anonymized version of the IP address."""
@@ -648,19 +779,128 @@ class ClientManager:
         self.server = server
         self.cur_id = [i for i in range(self.server.config['playerlimit'])]
 
+        # Secondary indexes of connected clients
+        self.clients_by_id = {}
+        self.clients_by_ipid = {}
+        self.clients_by_hdid = {}
+        # Keyed by lowercased OOC name
+        self.clients_by_name = {}
+        # Prefix indexes for targeting by the start of a string
+        self.ip_trie = PrefixTrie()
+        self.name_trie = PrefixTrie()
+        self.char_name_trie = PrefixTrie()
+
+    def _index_add(self, index: Dict[Any, set], key, client: Client):
+        index.setdefault(key, set()).add(client)
+
+    def _index_remove(self, index: Dict[Any, set], key, client: Client):
+        clients = index.get(key)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del index[key]
+
+    def reindex(self, client: Client, field: str, old, new):
+        """Update the index of a field after the client changed it.
+
+        Args:
+            client (Client): client whose field changed
+            field (str): 'name', 'hdid' or 'char_id'
+            old: previous value of the field
+            new: new value of the field
+        """
+        if client not in self.clients:
+            return
+        if field == 'name':
+            self._index_remove(self.clients_by_name, old.lower(), client)
+            self._index_add(self.clients_by_name, new.lower(), client)
+            self._index_name_prefix(client)
+        elif field == 'hdid':
+            self._index_remove(self.clients_by_hdid, old, client)
+            self._index_add(self.clients_by_hdid, new, client)
+        elif field == 'char_id':
+            self.char_name_trie.add(client.char_name.lower(), client)
+
+    def _index_name_prefix(self, client: Client):
+        # Clients without an OOC name are never targeted by name
+        if client.name:
+            self.name_trie.add(client.name.lower(), client)
+        else:
+            self.name_trie.remove(client)
+
+    def reindex_char_names(self):
+        """Rebuild the character name index after the character list
+        has been reloaded."""
+        self.swap_char_name_index(
+            self.build_char_name_index(self.server.char_list))
+
+    def build_char_name_index(self, char_list: List[str]) -> tuple:
+        """Build the character name index for a new character list,
+        without changing any client.
+
+        Args:
+            char_list (List[str]): new character list
+
+        Returns:
+            tuple: the index, and the clients whose character is not in
+            the new list
+        """
+        char_name_trie = PrefixTrie()
+        removed = []
+        for client in self.clients:
+            if client.char_id == -1:
+                char_name = 'Spectator'
+            elif client.char_id < len(char_list):
+                char_name = char_list[client.char_id]
+            else:
+                char_name = 'Spectator'
+                removed.append(client)
+            char_name_trie.add(char_name.lower(), client)
+        return char_name_trie, removed
+
+    def swap_char_name_index(self, index: tuple):
+        """Swap in a character name index from `build_char_name_index`,
+        once the new character list is in place. Clients whose character
+        is no longer in the list become spectators, freeing their
+        character in their area.
+
+        Args:
+            index (tuple): result of `build_char_name_index`
+        """
+        self.char_name_trie, removed = index
+        for client in removed:
+            client.char_id = -1
+
+    def get_client_by_id(self, client_id: int):
+        """Get the connected client with a player ID, or None."""
+        return self.clients_by_id.get(client_id)
+
+    def get_clients_by_ipid(self, ipid: int) -> set:
+        """Get the connected clients with an IPID."""
+        return self.clients_by_ipid.get(ipid, set())
+
+    def get_clients_by_hdid(self, hdid: str) -> set:
+        """Get the connected clients with an HDID."""
+        return self.clients_by_hdid.get(hdid, set())
+
+    def get_clients_by_name(self, name: str) -> set:
+        """Get the connected clients whose OOC name matches, ignoring case."""
+        return self.clients_by_name.get(name.lower(), set())
+
+    def connection_count(self, ipid: int) -> int:
+        """Get the number of connected clients with an IPID."""
+        return len(self.clients_by_ipid.get(ipid, ()))
+
     def new_client_preauth(self, client: Client) -> bool:
         maxclients = self.server.config['multiclient_limit']
-        for c in self.server.client_manager.clients:
-            if c.ipid == client.ipid:
-                if c.clientscon > maxclients:
-                    return False
-        return True
+        return self.connection_count(client.ipid) <= maxclients
 
-    def new_client(self, transport: asyncio.Transport) -> Client:
+    def new_client(self, transport: asyncio.Transport, ipid: int) -> Client:
         """Create a new client, add it to the list, and assign it a player ID.
 
         Args:
             transport (asyncio.Transport): Transport to send data across
+            ipid (int): IPID of the address of the client
 
         Raises:
             ClientError: The server is full
@@ -674,16 +914,15 @@ class ClientManager:
             transport.write(b'BD#This server is full.#%')
             raise ClientError
 
-        peername = transport.get_extra_info('peername')[0]
-
-        c = self.Client(
-            self.server, transport, user_id,
-            database.ipid(peername))
+        c = self.Client(self.server, transport, user_id, ipid)
         self.clients.add(c)
-        temp_ipid = c.ipid
-        for client in self.server.client_manager.clients:
-            if client.ipid == temp_ipid:
-                client.clientscon += 1
+        self.clients_by_id[c.id] = c
+        self._index_add(self.clients_by_ipid, c.ipid, c)
+        self._index_add(self.clients_by_hdid, c.hdid, c)
+        self._index_add(self.clients_by_name, c.name.lower(), c)
+        self.ip_trie.add(str(c.ip).lower(), c)
+        self._index_name_prefix(c)
+        self.char_name_trie.add(c.char_name.lower(), c)
         return c
 
     def remove_client(self, client: Client):
@@ -694,19 +933,59 @@ class ClientManager:
         """
         if client.area.jukebox:
             client.area.remove_jukebox_vote(client, True)
-        for a in self.server.area_manager.areas:
-            if client in a.owners:
-                a.owners.remove(client)
-                client.server.area_manager.send_arup_cms()
-                if len(a.owners) == 0:
-                    if a.is_locked != a.Locked.FREE:
-                        a.unlock()
+        for a in self.server.area_manager.get_owned_areas(client):
+            a.remove_owner(client)
+            client.server.area_manager.send_arup_cms()
+            if len(a.owners) == 0:
+                if a.is_locked != a.Locked.FREE:
+                    a.unlock()
         heappush(self.cur_id, client.id)
-        temp_ipid = client.ipid
-        for c in self.server.client_manager.clients:
-            if c.ipid == temp_ipid:
-                c.clientscon -= 1
         self.clients.remove(client)
+        del self.clients_by_id[client.id]
+        self._index_remove(self.clients_by_ipid, client.ipid, client)
+        self._index_remove(self.clients_by_hdid, client.hdid, client)
+        self._index_remove(self.clients_by_name, client.name.lower(), client)
+        self.ip_trie.remove(client)
+        self.name_trie.remove(client)
+        self.char_name_trie.remove(client)
+
+    def broadcast_command(self, clients, command: str, *args):
+        """Send an AO-compatible command to several clients at once.
+
+        Clients are grouped by protocol bucket, and the packet is then
+        serialized and encoded only once per bucket and evidence index.
+
+        Args:
+            clients (Iterable[Client]): recipients
+            command (str): command name
+            *args: tuple containing the packet arguments
+        """
+        buckets = {}
+        for client in clients:
+            buckets.setdefault(client.protocol_bucket, []).append(client)
+        for bucket, bucket_clients in buckets.items():
+            self.broadcast_to_bucket(bucket, bucket_clients, command, *args)
+
+    def broadcast_to_bucket(self, bucket: bool, clients, command: str, *args):
+        """Send an AO-compatible command to clients of the same protocol
+        bucket, writing the same bytes to every client that shares an
+        evidence index.
+
+        Args:
+            bucket (bool): protocol bucket of the recipients
+            clients (Iterable[Client]): recipients
+            command (str): command name
+            *args: tuple containing the packet arguments
+        """
+        args = self.Client.adapt_to_bucket(command, args, bucket)
+        packets = {}
+        for client in clients:
+            evi_num = client.get_evidence_num(command, args)
+            packet = packets.get(evi_num)
+            if packet is None:
+                packet = packets[evi_num] = self.Client.encode_command(
+                    command, *self.Client.remap_evidence(args, evi_num))
+            client.transport.write(packet)
 
     def get_targets(self, client: Client, key: TargetType, value: Any, local=False, single=False) -> List[Client]:
         """Find players by a combination of identifying data.
@@ -724,38 +1003,42 @@ class ClientManager:
             List[Client]: A list containing the targeted clients
         """
 
-        areas = None
-        if local:
-            areas = [client.area]
-        else:
-            areas = client.server.area_manager.areas
-        targets = []
         if key == TargetType.ALL:
-            for nkey in range(6):
+            # Every key that can be matched by a string
+            targets = []
+            for nkey in (TargetType.IP, TargetType.OOC_NAME,
+                         TargetType.CHAR_NAME, TargetType.HDID):
                 targets += self.get_targets(client, nkey, value, local)
-        for area in areas:
-            for client in area.clients:
-                if key == TargetType.IP:
-                    if value.lower().startswith(client.ip.lower()):
-                        targets.append(client)
-                elif key == TargetType.OOC_NAME:
-                    if value.lower().startswith(
-                            client.name.lower()) and client.name:
-                        targets.append(client)
-                elif key == TargetType.CHAR_NAME:
-                    if value.lower().startswith(
-                            client.char_name.lower()):
-                        targets.append(client)
-                elif key == TargetType.ID:
-                    if client.id == value:
-                        targets.append(client)
-                elif key == TargetType.IPID:
-                    if client.ipid == value:
-                        targets.append(client)
-                elif key == TargetType.AFK:
-                    if client in area.afkers:
-                        targets.append(client)
-        return targets
+            return list(dict.fromkeys(targets))
+
+        if key == TargetType.AFK:
+            areas = [client.area] if local else client.server.area_manager.areas
+            targets = []
+            for area in areas:
+                targets += [c for c in area.afkers if c in area.clients]
+            return targets
+
+        # Look up the matching clients in the index of the key
+        if key == TargetType.ID:
+            match = self.clients_by_id.get(value)
+            candidates = [match] if match is not None else []
+        elif key == TargetType.IPID:
+            candidates = self.get_clients_by_ipid(value)
+        elif key == TargetType.HDID:
+            candidates = self.get_clients_by_hdid(value)
+        elif key == TargetType.IP:
+            # Clients whose IP is a prefix of the value
+            candidates = self.ip_trie.prefixes_of(str(value).lower())
+        elif key == TargetType.OOC_NAME:
+            candidates = self.name_trie.prefixes_of(value.lower())
+        elif key == TargetType.CHAR_NAME:
+            candidates = self.char_name_trie.prefixes_of(value.lower())
+        else:
+            return []
+
+        if local:
+            return [c for c in candidates if c.area is client.area]
+        return list(candidates)
 
     def get_muted_clients(self):
         """Get a list of muted clients."""
@@ -1,6 +1,9 @@
 from dataclasses import dataclass
 from datetime import datetime
+import asyncio
+import logging
 import shlex
+import time
 import arrow
 import json
 
@@ -11,6 +14,8 @@ from server.constants import TargetType
 from server.exceptions import ClientError, ServerError, ArgumentError
 from . import mod_only, list_commands, list_submodules, help
 
+logger = logging.getLogger('debug')
+
 __all__ = [
     'ooc_cmd_motd',
     'ooc_cmd_help',
@@ -29,7 +34,8 @@ __all__ = [
     'ooc_cmd_ooc_mute',
     'ooc_cmd_ooc_unmute',
     'ooc_cmd_bans',
-    'ooc_cmd_baninfo'
+    'ooc_cmd_baninfo',
+    'ooc_cmd_cachestats'
 ]
 
 
@@ -435,13 +441,35 @@ def ooc_cmd_refresh(client, arg):
     """
     if len(arg) > 0:
         raise ClientError('This command does not take in any arguments!')
-    else:
-        try:
-            client.server.refresh()
-            database.log_misc('refresh', client)
-            client.send_ooc('You have reloaded the server.')
-        except ServerError:
-            raise
+    if client.server.refreshing:
+        raise ClientError('The server is already being refreshed.')
+    client.send_ooc('Reloading the server...')
+    asyncio.ensure_future(_refresh(client))
+
+
+async def _refresh(client):
+    """Refresh the server in the background and report the changes."""
+    start_time = time.perf_counter()
+    try:
+        state = await client.server.read_refresh_async()
+    except Exception as ex:
+        logger.exception('Refresh failed')
+        client.send_ooc(f'Refresh failed, nothing was changed: {ex}')
+        return
+    try:
+        changes = client.server.apply_refresh(state)
+    except Exception as ex:
+        # Failures happen before the new state is swapped in, but some
+        # command modules may have been reloaded
+        logger.exception('Refresh failed while applying')
+        client.send_ooc('Refresh failed, the configuration was not changed '
+                        f'but commands may have been reloaded: {ex}')
+        return
+    elapsed = time.perf_counter() - start_time
+    database.log_misc('refresh', client, data={'changes': changes})
+    client.send_ooc(
+        f'You have reloaded the server in {elapsed * 1000:.0f} ms.\n' +
+        ('\n'.join(changes) if changes else 'No changes.'))
 
 
 def ooc_cmd_online(client, _):
@@ -565,3 +593,25 @@ def ooc_cmd_baninfo(client, arg):
             else:
                 msg += 'Unban date: N/A'
         client.send_ooc(msg)
+
+
+@mod_only()
+def ooc_cmd_cachestats(client, _arg):
+    """
+    Show how often the server caches are hit.
+    Usage: /cachestats
+    """
+    caches = {
+        'GeoIP ASN': client.server.asn_cache,
+        'IPID': database.ipid_cache,
+        'Not banned': database.not_banned_cache
+    }
+    msg = 'Cache statistics:'
+    for name, cache in caches.items():
+        stats = cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        hit_rate = stats['hits'] / lookups if lookups else 0
+        msg += f'\n{name}: {stats["size"]}/{stats["max_size"]} entries, ' \
+               f'{stats["hits"]} hits, {stats["misses"]} misses ' \
+               f'({hit_rate:.0%} hit rate)'
+    client.send_ooc(msg)
@@ -104,7 +104,7 @@ def ooc_cmd_cm(client, arg):
             raise ArgumentError(
                 'You cannot \'nominate\' people to be CMs when you are not one.'
             )
-        client.area.owners.append(client)
+        client.area.add_owner(client)
         if client.area.evidence_mod == 'HiddenCM':
             client.area.broadcast_evidence_list()
         client.server.area_manager.send_arup_cms()
@@ -128,7 +128,7 @@ def ooc_cmd_cm(client, arg):
                         '{} [{}] is already a CM here.'.format(
                             c.char_name, c.id))
                 else:
-                    client.area.owners.append(c)
+                    client.area.add_owner(c)
                     if client.area.evidence_mod == 'HiddenCM':
                         client.area.broadcast_evidence_list()
                     client.server.area_manager.send_arup_cms()
@@ -159,7 +159,7 @@ def ooc_cmd_uncm(client, arg):
             c = client.server.client_manager.get_targets(
                 client, TargetType.ID, id, False)[0]
             if c in client.area.owners:
-                client.area.owners.remove(c)
+                client.area.remove_owner(c)
                 client.server.area_manager.send_arup_cms()
                 client.area.broadcast_ooc(
                     '{} [{}] is no longer CM in this area.'.format(
@@ -179,7 +179,7 @@ def ooc_cmd_clear_cm(client, arg):
     Removes all case managers from the current area.
     Usage: /clear_cm
     """
-    client.area.owners = []
+    client.area.clear_owners()
     client.server.area_manager.send_arup_cms()
     client.area.broadcast_ooc(
                     '{} [{}] is no longer CM in this area.'.format(
@@ -44,10 +44,7 @@ def ooc_cmd_s(client, arg):
     Send a message to all areas that you are a CM in.
     Usage: /s <message>
     """
-    areas = []
-    for a in client.server.area_manager.areas:
-        if client in a.owners:
-            areas.append(a)
+    areas = client.server.area_manager.get_owned_areas(client)
     if not areas:
         client.send_ooc('You aren\'t a CM in any area!')
         return
@@ -6,6 +6,7 @@ import datetime
 import pytimeparse
 
 from server import database
+from server.config_loader import load_yaml
 from server.exceptions import ClientError, ServerError, ArgumentError
 
 from . import mod_only
@@ -158,9 +159,7 @@ def ooc_cmd_rolla_reload(client, arg):
 
 def rolla_reload(area):
     try:
-        import yaml
-        with open('config/dice.yaml', 'r') as dice:
-            area.ability_dice = yaml.safe_load(dice)
+        area.ability_dice = load_yaml('config/dice.yaml')
     except:
         raise ServerError(
             'There was an error parsing the ability dice configuration. Check your syntax.'
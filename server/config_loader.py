@@ -0,0 +1,91 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import yaml
+
+logger = logging.getLogger('debug')
+
+# libyaml's loader, if PyYAML was built with it, is much faster than the
+# pure Python one and parses the same documents
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+CACHE_DIR = 'storage/config_cache'
+
+
+def safe_load(stream):
+    """Parse a YAML document like yaml.safe_load.
+
+    :param stream: string, bytes or file
+    :returns: parsed document
+
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def load_yaml(path: str, cache_dir: str = CACHE_DIR):
+    """Read a YAML file, reusing the document parsed the last time if
+    the file did not change since.
+
+    Parsed documents are pickled in `cache_dir`, one file per YAML file,
+    keyed by the SHA-256 hash of its contents. The cache directory must
+    only be writable by the server.
+
+    :param path: path of the YAML file
+    :param cache_dir: directory of the parsed documents, or None to
+        always parse the file
+    :returns: parsed document
+    :raises: OSError if the file cannot be read, yaml.YAMLError if it
+        is invalid
+
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    if cache_dir is None:
+        return safe_load(data)
+
+    digest = hashlib.sha256(data).hexdigest()
+    cache_file = os.path.join(
+        cache_dir, os.path.normpath(path).replace(os.sep, '_') + '.pickle')
+    try:
+        with open(cache_file, 'rb') as file:
+            cached_digest, document = pickle.load(file)
+        if cached_digest == digest:
+            return document
+    except FileNotFoundError:
+        pass
+    except Exception as ex:
+        # A damaged cache file is parsed again and overwritten
+        logger.warning(f'Could not read config cache {cache_file}: {ex}')
+
+    document = safe_load(data)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Files may be loaded from several threads at once
+        fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as file:
+            pickle.dump((digest, document), file,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+    except OSError as ex:
+        logger.warning(f'Could not write config cache {cache_file}: {ex}')
+    return document
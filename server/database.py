@@ -1,8 +1,12 @@
 import os
 
 import asyncio
+import atexit
+import queue
 import sqlite3
 import json
+import threading
+import time
 
 import arrow
 
@@ -10,39 +14,348 @@ import logging
 logger = logging.getLogger('debug')
 event_logger = logging.getLogger('events')
 
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime
 from functools import reduce
 from textwrap import dedent
 from typing import List
 
+from .cache import LRUCache
 from .exceptions import ServerError
 
 
 DB_FILE = 'storage/db.sqlite3'
 _database_singleton = None
+_database_options = {}
+
+# Connection settings applied to every connection to the database.
+# 'legacy' is the SQLite default of a rollback journal that is synced
+# on every commit. 'tuned' uses a write-ahead log, which lets readers
+# and the log writer work concurrently and only syncs on checkpoints.
+PROFILES = {
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'mmap_size': 0,
+        'cache_size': -2000
+    },
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 64 * 1024 * 1024,
+        'cache_size': -16000
+    }
+}
+
+# Statements on hot paths. Keeping them as constants avoids dedenting
+# them on every call, and lets sqlite3 reuse the prepared statements
+# from its statement cache.
+SQL_INSERT_IPID = dedent('''
+    INSERT OR IGNORE INTO ipids(ipid, ip_address) VALUES (NULL, ?)
+    ''')
+SQL_SELECT_IPID = dedent('''
+    SELECT ipid FROM ipids WHERE ip_address = ?
+    ''')
+SQL_INSERT_HDID = dedent('''
+    INSERT OR IGNORE INTO hdids(hdid, ipid) VALUES (?, ?)
+    ''')
+SQL_FIND_BAN = dedent('''
+    SELECT *
+    FROM (
+        SELECT ban_id FROM ip_bans WHERE ipid = ?
+        UNION SELECT ban_id FROM hdid_bans WHERE hdid = ?
+        UNION SELECT ban_id FROM bans WHERE ban_id = ?
+    )
+    JOIN bans USING (ban_id) WHERE unbanned = 0
+    ''')
+SQL_LAST_KNOWN_NAME = dedent('''
+    SELECT ooc_name FROM room_events
+    WHERE ipid = ? AND ooc_name IS NOT NULL AND ooc_name != ''
+    ORDER BY event_time DESC LIMIT 1
+    ''')
+SQL_BAN_IPIDS = dedent('''
+    SELECT ipid FROM ip_bans WHERE ban_id = ?
+    ''')
+SQL_BAN_HDIDS = dedent('''
+    SELECT hdid FROM hdid_bans WHERE ban_id = ?
+    ''')
+SQL_PENDING_UNBANS = dedent('''
+    SELECT ban_id FROM bans
+    WHERE unban_date IS NOT NULL AND unbanned = 0 AND
+        datetime(unban_date) < datetime(?, '+12 hours')
+    ''')
+SQL_LOG_IC = dedent('''
+    INSERT INTO ic_events(event_time, ipid, room_name, char_name,
+        ic_name, message) VALUES (?, ?, ?, ?, ?, ?)
+    ''')
+SQL_LOG_ROOM = dedent('''
+    INSERT INTO room_events(event_time, ipid, room_name, char_name,
+        ooc_name, event_subtype, message, target_ipid)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''')
+SQL_LOG_CONNECT = dedent('''
+    INSERT INTO connect_events(event_time, ipid, hdid, failed)
+    VALUES (?, ?, ?, ?)
+    ''')
+SQL_LOG_MISC = dedent('''
+    INSERT INTO misc_events(event_time, ipid, target_ipid,
+        event_subtype, event_data) VALUES (?, ?, ?, ?, ?)
+    ''')
 
 def __getattr__(name):
     global _database_singleton
+    if name.startswith('__'):
+        # Do not open the database for introspection, e.g. by pytest
+        raise AttributeError(name)
     if _database_singleton is None:
-        _database_singleton = Database()
+        _database_singleton = Database(**_database_options)
     return getattr(_database_singleton, name)
 
 
+def configure(options):
+    """
+    Set the options used to create the database singleton.
+    This must be called before the database is first used.
+    """
+    global _database_options
+    _database_options = dict(options or {})
+
+
+def get_pragmas(profile='tuned', pragmas=None):
+    """
+    Get the connection settings of a profile, with any overrides.
+    :param profile: name of a profile in PROFILES
+    :param pragmas: dict of settings overriding those of the profile
+    """
+    if profile not in PROFILES:
+        raise ServerError(f'Unknown database profile {profile}.')
+    settings = dict(PROFILES[profile])
+    for name, value in (pragmas or {}).items():
+        if name not in settings:
+            raise ServerError(f'Unknown database setting {name}.')
+        if not str(value).lstrip('-').isalnum():
+            raise ServerError(f'Invalid value for database setting {name}.')
+        settings[name] = value
+    return settings
+
+
+def apply_pragmas(conn, pragmas):
+    """Apply connection settings to an SQLite connection."""
+    conn.execute('PRAGMA foreign_keys = ON')
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name} = {value}')
+
+
+class EventLogWriter:
+    """
+    Write-behind queue for log events.
+
+    Events are queued in memory and written by a dedicated thread, in
+    batches of up to `batch_size` events per transaction. A batch is
+    written once it is full or `flush_interval` seconds after its first
+    event was queued, or at once when `flush` is called. When the queue
+    holds `max_size` events, new events are dropped and counted, so that
+    logging never blocks the event loop.
+    """
+
+    _STOP = object()
+    _FLUSH = object()
+
+    def __init__(self, db_file, flush_interval=1.0, batch_size=500,
+                 max_size=10000, pragmas=None):
+        self.db_file = db_file
+        self.pragmas = pragmas or {}
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_size = max_size
+        # Unbounded, so that _STOP and _FLUSH can always be queued;
+        # `put` enforces max_size
+        self.queue = queue.Queue()
+
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.dropped = 0
+        self.high_water = 0
+
+        self.closed = False
+        self.thread = threading.Thread(target=self._run,
+                                       name='EventLogWriter', daemon=True)
+        self.thread.start()
+
+    def put(self, sql, params):
+        """Queue a statement to be executed by the writer thread."""
+        if self.closed:
+            logger.warning(f'Dropped log event after shutdown: {params}')
+            return
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                logger.warning(f'Log queue is full, {self.dropped} events dropped')
+            return
+        self.queue.put_nowait((sql, params))
+        self.enqueued += 1
+        self.high_water = max(self.high_water, self.queue.qsize())
+
+    def flush(self, timeout=5.0):
+        """Have the writer write all queued events at once, and block
+        until they are written or `timeout` seconds have passed."""
+        if self.closed or not self.thread.is_alive():
+            return
+        done = threading.Event()
+        self.queue.put_nowait((self._FLUSH, done))
+        if not done.wait(timeout):
+            logger.warning(f'Log events were not written within {timeout} s')
+
+    def close(self):
+        """Write all pending events and stop the writer thread."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(self._STOP)
+        self.thread.join()
+
+    def stats(self):
+        """Get the metrics of the queue."""
+        return {
+            'pending': self.queue.qsize(),
+            'capacity': self.max_size,
+            'high_water': self.high_water,
+            'enqueued': self.enqueued,
+            'written': self.written,
+            'failed': self.failed,
+            'batches': self.batches,
+            'dropped': self.dropped
+        }
+
+    def _run(self):
+        try:
+            conn = sqlite3.connect(self.db_file, timeout=30)
+            apply_pragmas(conn, self.pragmas)
+        except Exception:
+            logger.exception('Could not open the database for log events')
+            return
+        stopping = False
+        while not stopping:
+            # Flushes to signal once the batch is written
+            flushes = []
+            batch = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is self._STOP:
+                    stopping = True
+                    break
+                if item[0] is self._FLUSH:
+                    flushes.append(item[1])
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        item = self.queue.get(timeout=timeout)
+                    else:
+                        item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    self._write_batch(conn, batch)
+                except Exception:
+                    self.failed += len(batch)
+                    logger.exception('Could not write log events')
+            for done in flushes:
+                done.set()
+        conn.close()
+
+    def _write_batch(self, conn, batch):
+        try:
+            with conn:
+                for sql, params in batch:
+                    conn.execute(sql, params)
+            self.written += len(batch)
+        except Exception:
+            # Something in the batch is bad, so retry the events one by
+            # one to write as many of them as possible.
+            for sql, params in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                    self.written += 1
+                except Exception:
+                    self.failed += 1
+                    logger.exception(f'Could not write log event {params}')
+        self.batches += 1
+
+
 class Database:
     """
     Represents a connection to an SQLite database that persists
     information about the server, such as users, bans, and logs.
     """
 
-    def __init__(self):
+    def __init__(self, log_flush_interval=1.0, log_batch_size=500,
+                 log_queue_size=10000, profile='tuned', pragmas=None,
+                 ipid_cache_size=4096, ban_cache_size=4096):
         new = not os.path.exists('storage/db.sqlite3')
+        self.pragmas = get_pragmas(profile, pragmas)
         self.db = sqlite3.connect(DB_FILE)
-        self.db.execute('PRAGMA foreign_keys = ON')
+        apply_pragmas(self.db, self.pragmas)
         self.db.row_factory = sqlite3.Row
         if new:
             self.migrate_json_to_v1()
         self.migrate()
+        self.load_subtype_atoms()
+
+        self.log_writer = EventLogWriter(DB_FILE, log_flush_interval,
+                                         log_batch_size, log_queue_size,
+                                         self.pragmas)
+
+        # Database work on the connection path is done on a dedicated
+        # thread with its own connection, so that a flood of connections
+        # does not block the event loop.
+        self.handshake_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='HandshakeDB')
+        self.handshake_local = threading.local()
+        self.ipid_cache = LRUCache(ipid_cache_size)
+        # Keys are (ipid, hdid) pairs that were found not to be banned
+        self.not_banned_cache = LRUCache(ban_cache_size)
+        self.ban_generation = 0
+
+        atexit.register(self.close)
+
+    def close(self):
+        """Write all pending log events and close the database."""
+        self.handshake_executor.shutdown(wait=True)
+        self.log_writer.close()
+        self.db.close()
+
+    def _run_handshake_query(self, func, *args):
+        """
+        Run a query function on the handshake thread, passing it the
+        connection of that thread.
+        """
+        conn = getattr(self.handshake_local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(DB_FILE, timeout=30)
+            apply_pragmas(conn, self.pragmas)
+            conn.row_factory = sqlite3.Row
+            self.handshake_local.conn = conn
+        return func(conn, *args)
+
+    async def _handshake_query(self, func, *args):
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            self.handshake_executor, self._run_handshake_query, func, *args)
+
+    def _invalidate_ban_cache(self):
+        self.not_banned_cache.clear()
+        self.ban_generation += 1
 
     def migrate_json_to_v1(self):
         """Migrate to v1 of the database from JSON."""
@@ -120,7 +433,7 @@ class Database:
             logger.debug('Migration to v1 complete')
 
     def migrate(self):
-        for version in [2, 3, 4, 5, 6]:
+        for version in [2, 3, 4, 5, 6, 7]:
             self.migrate_to_version(version)
 
     def migrate_to_version(self, version):
@@ -134,23 +447,58 @@ class Database:
                 conn.executescript(file.read())
         logger.debug(f'Migration to v{version} complete')
 
+    @staticmethod
+    def _ipid(conn, ip):
+        with conn:
+            conn.execute(SQL_INSERT_IPID, (ip, ))
+            return conn.execute(SQL_SELECT_IPID, (ip, )).fetchone()['ipid']
+
     def ipid(self, ip):
         """Get an IPID from an IP address."""
-        with self.db as conn:
-            conn.execute(dedent('''
-                INSERT OR IGNORE INTO ipids(ipid, ip_address) VALUES (NULL, ?)
-                '''), (ip, ))
-            ipid = conn.execute(dedent('''
-                SELECT ipid FROM ipids WHERE ip_address = ?
-                '''), (ip, )).fetchone()['ipid']
-            return ipid
+        ipid = self.ipid_cache.get(ip)
+        if ipid is None:
+            ipid = self._ipid(self.db, ip)
+            self.ipid_cache.put(ip, ipid)
+        return ipid
+
+    async def ipid_async(self, ip):
+        """
+        Get an IPID from an IP address without blocking the event loop.
+        """
+        ipid = self.ipid_cache.get(ip)
+        if ipid is None:
+            ipid = await self._handshake_query(self._ipid, ip)
+            self.ipid_cache.put(ip, ipid)
+        return ipid
 
     def add_hdid(self, ipid, hdid):
         """Associate an HDID with an IPID."""
         with self.db as conn:
-            conn.execute(dedent('''
-                INSERT OR IGNORE INTO hdids(hdid, ipid) VALUES (?, ?)
-                '''), (hdid, ipid))
+            conn.execute(SQL_INSERT_HDID, (hdid, ipid))
+
+    @staticmethod
+    def _check_connect(conn, ipid, hdid):
+        with conn:
+            conn.execute(SQL_INSERT_HDID, (hdid, ipid))
+            ban = conn.execute(SQL_FIND_BAN, (ipid, hdid, None)).fetchone()
+        if ban is not None:
+            return Database.Ban(**ban)
+        return None
+
+    async def check_connect(self, ipid, hdid):
+        """
+        Associate an HDID with an IPID and check if either is banned,
+        without blocking the event loop.
+        A pair that is not banned is cached until the next ban or unban.
+        """
+        if self.not_banned_cache.get((ipid, hdid)):
+            return None
+        generation = self.ban_generation
+        ban = await self._handshake_query(self._check_connect, ipid, hdid)
+        # Only cache the result if no ban was made while it was queried
+        if ban is None and generation == self.ban_generation:
+            self.not_banned_cache.put((ipid, hdid), True)
+        return ban
 
     def ban(self,
             target_id,
@@ -168,6 +516,7 @@ class Database:
         """
         if ban_type not in ('ipid', 'hdid'):
             raise ServerError(f'Unknown ban type {ban_type}')
+        self._invalidate_ban_cache()
 
         with self.db as conn:
             if ban_id is None:
@@ -221,12 +570,9 @@ class Database:
         """
         Find the last known OOC name of an IPID.
         """
+        self.log_writer.flush()
         with self.db as conn:
-            row = conn.execute(dedent('''
-                SELECT ooc_name FROM room_events
-                WHERE ipid = ? AND ooc_name IS NOT NULL AND ooc_name != ''
-                ORDER BY event_time DESC LIMIT 1
-                '''), (ipid,)).fetchone()
+            row = conn.execute(SQL_LAST_KNOWN_NAME, (ipid,)).fetchone()
             if row is not None:
                 return row['ooc_name']
             else:
@@ -255,9 +601,7 @@ class Database:
             """Find IPIDs affected by this ban."""
             with _database_singleton.db as conn:
                 return [int(row['ipid']) for row in
-                    conn.execute(dedent('''
-                        SELECT ipid FROM ip_bans WHERE ban_id = ?
-                        '''), (self.ban_id,)).fetchall()
+                    conn.execute(SQL_BAN_IPIDS, (self.ban_id,)).fetchall()
                 ]
 
         @property
@@ -265,9 +609,7 @@ class Database:
             """Find HDIDs affected by this ban."""
             with _database_singleton.db as conn:
                 return [row['hdid'] for row in
-                    conn.execute(dedent('''
-                        SELECT hdid FROM hdid_bans WHERE ban_id = ?
-                        '''), (self.ban_id,)).fetchall()
+                    conn.execute(SQL_BAN_HDIDS, (self.ban_id,)).fetchall()
                 ]
 
         @property
@@ -291,15 +633,7 @@ class Database:
             #      room_events.ipid = banned_by AND
             #      ooc_name IS NOT NULL
             #   ORDER BY event_time DESC LIMIT 1
-            ban = conn.execute(dedent('''
-                SELECT *
-                FROM (
-                    SELECT ban_id FROM ip_bans WHERE ipid = ?
-                    UNION SELECT ban_id FROM hdid_bans WHERE hdid = ?
-                    UNION SELECT ban_id FROM bans WHERE ban_id = ?
-                )
-                JOIN bans USING (ban_id) WHERE unbanned = 0
-                '''), (ipid, hdid, ban_id)).fetchone()
+            ban = conn.execute(SQL_FIND_BAN, (ipid, hdid, ban_id)).fetchone()
             if ban is not None:
                 return Database.Ban(**ban)
             else:
@@ -328,6 +662,7 @@ class Database:
     def unban(self, ban_id):
         """Remove a ban entry."""
         event_logger.info(f'Unbanning {ban_id}')
+        self._invalidate_ban_cache()
         with self.db as conn:
             unbans = conn.execute(dedent('''
                 UPDATE bans SET unbanned = 1 WHERE ban_id = ?
@@ -345,11 +680,8 @@ class Database:
         """
         dated_bans = []
         with self.db as conn:
-            dated_bans = conn.execute(dedent('''
-                SELECT ban_id FROM bans
-                WHERE unban_date IS NOT NULL AND unbanned = 0 AND
-                    datetime(unban_date) < datetime(?, '+12 hours')
-                '''), (arrow.utcnow().datetime,)).fetchall()
+            dated_bans = conn.execute(SQL_PENDING_UNBANS,
+                                      (arrow.utcnow().datetime,)).fetchall()
 
         for ban in dated_bans:
             self._schedule_unban(ban['ban_id'])
@@ -371,12 +703,8 @@ class Database:
         """Log an IC message."""
         event_logger.info(f'[{room.abbreviation}] {showname}/{client.char_name}' +
                           f'/{client.name} ({client.ipid}): {message}')
-        with self.db as conn:
-            conn.execute(dedent('''
-                INSERT INTO ic_events(ipid, room_name, char_name, ic_name,
-                    message) VALUES (?, ?, ?, ?, ?)
-                '''), (client.ipid, room.abbreviation, client.char_name,
-                    showname, message))
+        self.log_writer.put(SQL_LOG_IC, (self._event_time(), client.ipid,
+            room.abbreviation, client.char_name, showname, message))
 
     def log_room(self, event_subtype, client, room, message=None, target=None):
         """
@@ -393,22 +721,16 @@ class Database:
 
         event_logger.info(f'[{room.abbreviation}] {client.char_name}' +
                     f'/{client.name} ({client.ipid}): event {event_subtype} ({message})')
-        with self.db as conn:
-            conn.execute(dedent('''
-                INSERT INTO room_events(ipid, room_name, char_name, ooc_name,
-                    event_subtype, message, target_ipid)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                '''), (ipid, room.abbreviation, char_name, ooc_name,
-                    subtype_id, message, target_ipid))
+        self.log_writer.put(SQL_LOG_ROOM, (self._event_time(), ipid,
+            room.abbreviation, char_name, ooc_name, subtype_id, message,
+            target_ipid))
 
     def log_connect(self, client, failed=False):
         """Log a connect attempt."""
         event_logger.info(f'{client.ipid} (HDID: {client.hdid}) ' +
                           f'{"was blocked from connecting" if failed else "connected"}.')
-        with self.db as conn:
-            conn.execute(dedent('''
-                INSERT INTO connect_events(ipid, hdid, failed) VALUES (?, ?, ?)
-                '''), (client.ipid, client.hdid, failed))
+        self.log_writer.put(SQL_LOG_CONNECT, (self._event_time(), client.ipid,
+            client.hdid, failed))
 
     def log_misc(self, event_subtype, client=None, target=None, data=None):
         """
@@ -421,11 +743,8 @@ class Database:
         data_json = json.dumps(data)
         event_logger.info(f'{event_subtype} ({client_ipid} onto {target_ipid}): {data}')
 
-        with self.db as conn:
-            conn.execute(dedent('''
-                INSERT INTO misc_events(ipid, target_ipid, event_subtype,
-                    event_data) VALUES (?, ?, ?, ?)
-                '''), (client_ipid, target_ipid, subtype_id, data_json))
+        self.log_writer.put(SQL_LOG_MISC, (self._event_time(), client_ipid,
+            target_ipid, subtype_id, data_json))
 
     def recent_bans(self, count=5):
         """
@@ -440,16 +759,47 @@ class Database:
                     ORDER BY ban_date ASC
                     '''), (count,)).fetchall()]
 
+    @staticmethod
+    def _event_time():
+        """
+        Get the current time in the format of CURRENT_TIMESTAMP, so that
+        queued events keep the time at which they happened.
+        """
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+
+    def load_subtype_atoms(self):
+        """
+        Load the event type tables into memory, replacing the cached IDs.
+        """
+        atoms = {}
+        with self.db as conn:
+            for event_type in ('room', 'misc'):
+                atoms[event_type] = {
+                    row['type_name']: row['type_id'] for row in
+                    conn.execute(dedent(f'''
+                        SELECT type_id, type_name FROM {event_type}_event_types
+                        '''))
+                }
+        self.subtype_atoms = atoms
+
     def _subtype_atom(self, event_type, event_subtype):
         if event_type not in ('room', 'misc'):
             raise AssertionError()
 
+        atoms = self.subtype_atoms[event_type]
+        try:
+            return atoms[event_subtype]
+        except KeyError:
+            pass
+
         with self.db as conn:
             conn.execute(dedent(f'''
                 INSERT OR IGNORE INTO {event_type}_event_types(type_name)
                 VALUES (?)
                 '''), (event_subtype,))
-            return conn.execute(dedent(f'''
+            type_id = conn.execute(dedent(f'''
                 SELECT type_id FROM {event_type}_event_types
                 WHERE type_name = ?
                 '''), (event_subtype,)).fetchone()['type_id']
+        atoms[event_subtype] = type_id
+        return type_id
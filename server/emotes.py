@@ -1,25 +1,101 @@
+import json
 import logging
+import os
+import sys
 
 from pathlib import Path
-from typing import Union, List
+from typing import Iterable, Union, List
 from configparser import ConfigParser, SectionProxy
 logger = logging.getLogger('debug')
 
 
+class EmoteAtoms:
+    """
+    Numbers every distinct animation pair and sound effect, so that the
+    emote tables of a character list share their strings and store each
+    emote as an integer.
+    """
+
+    def __init__(self):
+        # (preanim, anim) -> ID, and ID -> (preanim, anim)
+        self.pair_ids = {}
+        self.pairs = []
+        # sfx -> ID, and ID -> sfx
+        self.sfx_ids = {}
+        self.sfxs = []
+
+    def add_pair(self, preanim: str, anim: str) -> int:
+        pair = (preanim, anim)
+        pair_id = self.pair_ids.get(pair)
+        if pair_id is None:
+            pair = (sys.intern(preanim), sys.intern(anim))
+            pair_id = self.pair_ids[pair] = len(self.pairs)
+            self.pairs.append(pair)
+        return pair_id
+
+    def add_sfx(self, sfx: str) -> int:
+        sfx_id = self.sfx_ids.get(sfx)
+        if sfx_id is None:
+            sfx_id = self.sfx_ids[sys.intern(sfx)] = len(self.sfxs)
+            self.sfxs.append(sfx)
+        return sfx_id
+
+    @staticmethod
+    def sound_key(pair_id: int, sfx_id: int) -> int:
+        """Combine an animation pair and a sound effect into one integer."""
+        return pair_id << 32 | sfx_id
+
+
 class Emotes:
     """
     Represents a list of emotes read in from a character INI file
     used for validating which emotes can be sent by clients.
+
+    Emotes are stored as IDs from `atoms`: the animation pairs of the
+    character, which may always be played without a sound effect, and
+    the animation pairs combined with the sound effect they come with.
+    Tables that share an EmoteAtoms share their strings.
     """
     REQUIRED_INI_SECTIONS = ['Options', 'Emotions']
     VALID_EMOTION_SECTIONS = ['number']
 
-    def __init__(self, name: str):
+    __slots__ = ('CHAR_DIR', 'name', 'atoms', 'anims', 'sounds', '_anims',
+                 '_sounds')
+
+    def __init__(self, name: str, emotes: Iterable[tuple] = None,
+                 atoms: EmoteAtoms = None):
         self.CHAR_DIR = 'characters'
         self.name = name
-        self.emotes = set()
+        self.atoms = atoms if atoms is not None else EmoteAtoms()
+        self._anims = set()
+        self._sounds = set()
+
+        if emotes is None:
+            self._add_emotes()
+        else:
+            for preanim, anim, sfx in emotes:
+                self._add(preanim, anim, sfx)
+
+        self.anims = frozenset(self._anims)
+        self.sounds = frozenset(self._sounds)
+        del self._anims, self._sounds
 
-        self._add_emotes()
+    @property
+    def emotes(self) -> set:
+        """The emotes of the character, as (preanim, anim, sfx) tuples."""
+        pairs, sfxs = self.atoms.pairs, self.atoms.sfxs
+        emotes = {pairs[pair_id] + (None,) for pair_id in self.anims}
+        for key in self.sounds:
+            emotes.add(pairs[key >> 32] + (sfxs[key & 0xffffffff],))
+        return emotes
+
+    def _add(self, preanim: str, anim: str, sfx: Union[str, None]):
+        pair_id = self.atoms.add_pair(preanim, anim)
+        # No SFX should always be allowed
+        self._anims.add(pair_id)
+        if sfx is not None:
+            self._sounds.add(
+                self.atoms.sound_key(pair_id, self.atoms.add_sfx(sfx)))
 
     @classmethod
     def _has_valid_ini_sections(cls, char_ini: ConfigParser) -> bool:
@@ -72,10 +148,7 @@ class Emotes:
                 _name, preanim, anim, _mod = emotion_information.split('#')[
                     :4]
                 sfx = self._get_sfx(emote_id, char_ini)
-                self.emotes.add((preanim, anim, sfx))
-
-                # No SFX should always be allowed
-                self.emotes.add((preanim, anim, None))
+                self._add(preanim, anim, sfx)
 
     @staticmethod
     def _get_sfx(emote_id: str, char_ini: ConfigParser) -> Union[str, None]:
@@ -95,9 +168,124 @@ class Emotes:
         character (that is, it is defined server-side).
         """
         # There are no emotes loaded, so allow anything
-        if len(self.emotes) == 0:
+        if not self.anims:
             return True
 
         if sfx is not None and len(sfx) <= 1:
             sfx = None
-        return (preanim, anim, sfx) in self.emotes
+        pair_id = self.atoms.pair_ids.get((preanim, anim))
+        if pair_id is None or pair_id not in self.anims:
+            return False
+        if sfx is None:
+            return True
+        sfx_id = self.atoms.sfx_ids.get(sfx)
+        return sfx_id is not None and \
+            self.atoms.sound_key(pair_id, sfx_id) in self.sounds
+
+
+class EmoteTables:
+    """
+    The emote tables of every character, read from the character INI
+    files on first use.
+
+    Parsed tables are kept in an on-disk cache, keyed by the modification
+    time and size of each INI file, so that unchanged files are not
+    parsed again when the server restarts or is refreshed.
+    """
+
+    def __init__(self, char_list: List[str], cache_file: str = 'storage/emote_cache.json'):
+        self.CHAR_DIR = 'characters'
+        self.names = set(char_list)
+        self.tables = {}
+        # Shared by the tables of this character list only, so that
+        # strings of a previous list are freed along with it
+        self.atoms = EmoteAtoms()
+        self.cache_file = cache_file
+        self.cache = self._read_cache()
+        self.dirty = False
+        self.parsed = 0
+        self.cached = 0
+
+    def __getitem__(self, name: str) -> Emotes:
+        if name not in self.names:
+            raise KeyError(name)
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = self._load(name)
+        return table
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.names
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def inherit(self, other: 'EmoteTables'):
+        """Take over the tables parsed by a previous instance, so that
+        they do not need to be parsed again."""
+        for name, entry in other.cache.items():
+            if self.cache.get(name) != entry:
+                self.cache[name] = entry
+                self.dirty = True
+
+    def invalidate(self, name: str):
+        """Forget the table of a character whose INI file changed, so
+        that it is read again on next use."""
+        if self.tables.pop(name, None) is None:
+            return
+        # Rebuild the atoms without the strings of the old table
+        atoms = EmoteAtoms()
+        self.tables = {other: Emotes(other, table.emotes, atoms)
+                       for other, table in self.tables.items()}
+        self.atoms = atoms
+
+    def _read_cache(self) -> dict:
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as file:
+                cache = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as ex:
+            logger.warning(f'Could not read emote cache {self.cache_file}: {ex}')
+            return {}
+        return cache if isinstance(cache, dict) else {}
+
+    def _ini_key(self, name: str) -> Union[List[int], None]:
+        try:
+            stat = os.stat(Path(self.CHAR_DIR, name, 'char.ini'))
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _load(self, name: str) -> Emotes:
+        key = self._ini_key(name)
+        entry = self.cache.get(name)
+        if key is not None and entry is not None and entry.get('key') == key:
+            self.cached += 1
+            return Emotes(name, (tuple(emote) for emote in entry['emotes']),
+                          self.atoms)
+
+        table = Emotes(name, atoms=self.atoms)
+        self.parsed += 1
+        if key is not None:
+            self.cache[name] = {'key': key, 'emotes': sorted(
+                table.emotes, key=lambda emote: tuple(x or '' for x in emote))}
+            self.dirty = True
+        return table
+
+    def save(self):
+        """Write the tables parsed since the cache was read to disk."""
+        if not self.dirty:
+            return
+        # Only keep the characters that are still in the list
+        cache = {name: entry for name, entry in self.cache.items()
+                 if name in self.names}
+        tmp_file = f'{self.cache_file}.tmp'
+        try:
+            with open(tmp_file, 'w', encoding='utf-8') as file:
+                json.dump(cache, file)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as ex:
+            logger.warning(f'Could not write emote cache {self.cache_file}: {ex}')
+            return
+        self.dirty = False
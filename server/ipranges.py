@@ -0,0 +1,179 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import ipaddress
+import logging
+
+logger = logging.getLogger('debug')
+
+
+class IPRangeBans:
+    """Banned IP ranges and ASNs, as listed in iprange_ban.txt.
+
+    Each line of the file is one of:
+     - an IPv4 or IPv6 network in CIDR notation, or a single address
+     - the start of an IPv4 address, such as `192.168.` or `104.244.7`,
+       which bans every address whose text starts with it
+     - an ASN, such as `13335` or `AS13335`
+    Empty lines and lines starting with `#` are skipped. A ban is
+    identified by the number of its line, counting from 0.
+
+    Networks are stored in a binary trie per IP version, so that a
+    lookup takes one step per address bit, whatever the number of bans.
+    """
+
+    class Node:
+        __slots__ = ('children', 'ban_id')
+
+        def __init__(self):
+            self.children = [None, None]
+            self.ban_id = None
+
+    def __init__(self):
+        self.roots = {4: self.Node(), 6: self.Node()}
+        # ASN -> ban ID
+        self.asns = {}
+        # Valid lines
+        self.entries = []
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Compile the lines of iprange_ban.txt.
+
+        :param lines: lines of the file
+        :returns: IPRangeBans
+
+        """
+        bans = cls()
+        for ban_id, line in enumerate(lines):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            try:
+                networks = cls.parse_networks(line)
+            except ValueError:
+                logger.warning(f'Invalid IP range ban on line {ban_id}: {line}')
+                continue
+            bans.entries.append(line)
+            if networks is None:
+                asn = line[2:] if line[:2].upper() == 'AS' else line
+                bans.asns.setdefault(asn, ban_id)
+                continue
+            for network in networks:
+                bans.add_network(network, ban_id)
+        return bans
+
+    @staticmethod
+    def parse_networks(line: str):
+        """Parse a line of iprange_ban.txt into networks.
+
+        :param line: stripped line
+        :returns: list of networks, or None if the line is not an address
+        :raises: ValueError if the line looks like an address but is invalid
+
+        """
+        if '.' not in line and ':' not in line:
+            return None
+        try:
+            return [ipaddress.ip_network(line, strict=False)]
+        except ValueError:
+            if ':' in line or '/' in line:
+                raise
+        # Start of an IPv4 address. The last octet may be incomplete, in
+        # which case it matches every octet whose digits start with it.
+        octets = line.split('.')
+        if len(octets) > 4:
+            raise ValueError(line)
+        *complete, partial = octets
+        prefix = []
+        for octet in complete:
+            if not octet.isdigit() or int(octet) > 255:
+                raise ValueError(line)
+            prefix.append(int(octet))
+        if partial == '':
+            values = [None]
+        elif partial.isdigit():
+            values = [value for value in range(256)
+                      if str(value).startswith(partial)]
+        else:
+            raise ValueError(line)
+        networks = []
+        for value in values:
+            address = prefix if value is None else prefix + [value]
+            address_bits = 8 * len(address)
+            address = address + [0] * (4 - len(address))
+            networks.append(ipaddress.ip_network(
+                f'{".".join(map(str, address))}/{address_bits}'))
+        return networks
+
+    def add_network(self, network, ban_id: int):
+        """Ban a network.
+
+        :param network: ipaddress.IPv4Network or IPv6Network
+        :param ban_id: line of the ban
+
+        """
+        node = self.roots[network.version]
+        address = int(network.network_address)
+        bits = network.max_prefixlen
+        for i in range(network.prefixlen):
+            bit = (address >> (bits - 1 - i)) & 1
+            child = node.children[bit]
+            if child is None:
+                child = node.children[bit] = self.Node()
+            node = child
+        if node.ban_id is None or ban_id < node.ban_id:
+            node.ban_id = ban_id
+
+    def match_address(self, ip: str):
+        """Find the ban of an IP address.
+
+        :param ip: IP address
+        :returns: lowest line number of the networks containing the
+            address, or None
+
+        """
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        node = self.roots[address.version]
+        value = int(address)
+        bits = address.max_prefixlen
+        match = node.ban_id
+        for i in range(bits):
+            node = node.children[(value >> (bits - 1 - i)) & 1]
+            if node is None:
+                break
+            if node.ban_id is not None and (match is None or node.ban_id < match):
+                match = node.ban_id
+        return match
+
+    def match(self, ip: str, asn: str):
+        """Find the ban of a connection.
+
+        :param ip: IP address
+        :param asn: ASN of the address
+        :returns: lowest line number of the matching bans, or None
+
+        """
+        matches = [ban_id for ban_id in (self.match_address(ip),
+                                         self.asns.get(asn))
+                   if ban_id is not None]
+        return min(matches, default=None)
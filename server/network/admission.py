@@ -0,0 +1,173 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import asyncio
+
+from collections import deque
+from time import monotonic
+
+from server.cache import LRUCache
+
+
+class TokenBucket:
+    """Allows `burst` events at once, refilled at `rate` events per
+    second."""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now) -> bool:
+        """Take a token if one is available.
+
+        :param now: current monotonic time
+        :returns: True if a token was taken
+
+        """
+        self.tokens = min(self.burst,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionController:
+    """Decides which new connections may start a handshake.
+
+    A connection is refused at once when its IP address or its ASN is
+    out of tokens. Otherwise it takes one of `max_concurrent` handshake
+    slots, or waits for one in a queue of at most `queue_size`
+    connections for up to `queue_timeout` seconds. Slots are given back
+    with `release` once the handshake is over.
+    """
+
+    def __init__(self, ip_rate=0.5, ip_burst=16, asn_rate=5, asn_burst=50,
+                 max_concurrent=50, queue_size=200, queue_timeout=10,
+                 handshake_timeout=30, max_tracked=10000):
+        self.ip_rate = ip_rate
+        self.ip_burst = ip_burst
+        self.asn_rate = asn_rate
+        self.asn_burst = asn_burst
+        self.max_concurrent = max_concurrent
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.handshake_timeout = handshake_timeout
+
+        self.ip_buckets = LRUCache(max_tracked)
+        self.asn_buckets = LRUCache(max_tracked)
+        self.active = 0
+        self.waiters = deque()
+
+        self.admitted = 0
+        self.rejected_ip = 0
+        self.rejected_asn = 0
+        self.rejected_queue = 0
+        self.timed_out = 0
+
+    def _take(self, buckets, key, rate, burst, now) -> bool:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst, now)
+            buckets.put(key, bucket)
+        return bucket.take(now)
+
+    def check_rate(self, ip: str, asn: str = None) -> bool:
+        """Take a token from the buckets of an IP address and its ASN.
+
+        :param ip: IP address of the connection
+        :param asn: ASN of the address, or None if unknown
+        :returns: True if neither bucket is empty
+
+        """
+        now = monotonic()
+        if not self._take(self.ip_buckets, ip, self.ip_rate, self.ip_burst, now):
+            self.rejected_ip += 1
+            return False
+        if asn is not None and not self._take(
+                self.asn_buckets, asn, self.asn_rate, self.asn_burst, now):
+            self.rejected_asn += 1
+            return False
+        return True
+
+    async def admit(self, ip: str, asn: str = None) -> bool:
+        """Wait for a handshake slot for a new connection.
+
+        :param ip: IP address of the connection
+        :param asn: ASN of the address, or None if unknown
+        :returns: True if the connection was given a slot, which must
+            then be given back with `release`
+
+        """
+        if not self.check_rate(ip, asn):
+            return False
+        # Slots are handed over to waiting connections, so there are
+        # none waiting while a slot is free
+        if self.active < self.max_concurrent:
+            self.active += 1
+            self.admitted += 1
+            return True
+        if len(self.waiters) >= self.queue_size:
+            self.rejected_queue += 1
+            return False
+
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            self.timed_out += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+            elif waiter.done() and not waiter.cancelled():
+                # The slot was handed over just before
+                self.release()
+            raise
+        self.admitted += 1
+        return True
+
+    def release(self):
+        """Give back a handshake slot, handing it over to the oldest
+        waiting connection if there is one."""
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            # Skip connections that stopped waiting
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def stats(self) -> dict:
+        """Get the admission counters."""
+        return {
+            'active': self.active,
+            'queued': len(self.waiters),
+            'admitted': self.admitted,
+            'rejected_ip': self.rejected_ip,
+            'rejected_asn': self.rejected_asn,
+            'rejected_queue': self.rejected_queue,
+            'timed_out': self.timed_out
+        }
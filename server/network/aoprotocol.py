@@ -22,6 +22,7 @@ import logging
 import unicodedata
 import json
 
+from collections import deque
 from enum import Enum
 from typing import List
 from time import localtime, strftime, time
@@ -29,7 +30,7 @@ from time import localtime, strftime, time
 from .. import commands
 from server import database
 from server.fantacrypt import fanta_decrypt
-from server.constants import ESCAPE_CHARACTERS
+from server.network.framing import AOFramer
 from server.exceptions import ClientError, AreaError, ArgumentError, ServerError
 
 
@@ -41,23 +42,81 @@ class ProtocolError(Exception):
     pass
 
 
+class ArgType(Enum):
+    """Represents the data type of an argument for a network command."""
+    STR = 1,
+    STR_OR_EMPTY = 2,
+    INT = 3,
+    INT_OR_STR = 3
+
+
+def compile_validator(types):
+    """Compile the argument types of a net command layout into a
+    validator function.
+
+    The validator takes the list of arguments of a net command and
+    returns a new list in which INT arguments are converted, or None if
+    the arguments do not match the layout.
+
+    :param types: list of types corresponding to each argument in the command
+    :returns: validator function
+
+    """
+    non_empty = tuple(i for i, arg_type in enumerate(types)
+                      if arg_type != ArgType.STR_OR_EMPTY)
+    ints = tuple(i for i, arg_type in enumerate(types)
+                 if arg_type == ArgType.INT)
+
+    def validator(args):
+        for i in non_empty:
+            if len(args[i]) == 0:
+                return None
+        args = list(args)
+        for i in ints:
+            try:
+                args[i] = int(args[i])
+            except ValueError:
+                return None
+        return args
+    return validator
+
+
+def compile_validators(schemas):
+    """Compile a registry of net command layouts.
+
+    :param schemas: dict of command name to list of layouts
+    :returns: dict of (command name, argument count) to validator
+
+    """
+    validators = {}
+    for cmd, layouts in schemas.items():
+        for types in layouts:
+            if (cmd, len(types)) in validators:
+                raise ValueError(f'Ambiguous layouts for {cmd} with {len(types)} arguments')
+            validators[(cmd, len(types))] = compile_validator(types)
+    return validators
+
+
 class AOProtocol(asyncio.Protocol):
     """The main class that deals with the AO protocol."""
     last_message_char_id: int = -1
 
-    class ArgType(Enum):
-        """Represents the data type of an argument for a network command."""
-        STR = 1,
-        STR_OR_EMPTY = 2,
-        INT = 3,
-        INT_OR_STR = 3
+    ArgType = ArgType
 
     def __init__(self, server):
         super().__init__()
         self.server = server
         self.client = None
-        self.buffer = ''
+        self.transport = None
+        self.framer = AOFramer()
         self.ping_timeout = None
+        # Messages are held here while an asynchronous handler runs
+        self.pending_messages = deque()
+        self.pending_task = None
+        self.closed = False
+        # Whether the connection holds a handshake slot
+        self.handshaking = False
+        self.handshake_timeout = None
 
     def dezalgo(self, input):
         """
@@ -90,24 +149,36 @@ class AOProtocol(asyncio.Protocol):
         :param data: bytes of data
 
         """
-        buf = data
-        ipid = self.client.ipid
+        if self.client is None and self.pending_task is None:
+            # The connection was refused
+            return
 
-        if buf is None:
-            buf = b''
+        if data is None:
+            data = b''
+        if isinstance(data, str):
+            data = data.encode('utf-8')
 
-        if not isinstance(buf, str):
-            # try to decode as utf-8, ignore any erroneous characters
-            self.buffer += buf.decode('utf-8', 'ignore')
-        else:
-            self.buffer = buf
+        self.framer.feed(data)
 
-        self.buffer = self.buffer.translate({ord(c): None for c in '\0'})
+        # The limit counts characters, as it did when the buffer was a str
+        if self.framer.char_count > 8192:
+            self.transport.close()
+        try:
+            self.pending_messages.extend(self.get_messages())
+        except ProtocolError:
+            self.transport.close()
+            return
+        self.process_messages()
 
-        if len(self.buffer) > 8192:
-            self.client.disconnect()
+    def process_messages(self):
+        """Passes received messages to their command handlers, stopping
+        while an asynchronous handler has not finished."""
+        if self.client is None:
+            return
+        ipid = self.client.ipid
         try:
-            for msg in self.get_messages():
+            while self.pending_messages and self.pending_task is None:
+                msg = self.pending_messages.popleft()
                 if len(msg) < 2:
                     continue
                 # general netcode structure is not great
@@ -118,7 +189,9 @@ class AOProtocol(asyncio.Protocol):
                     msg = '#'.join([fanta_decrypt(spl[0])] + spl[1:])
                 try:
                     cmd, *args = msg.split('#')
-                    self.net_cmd_dispatcher[cmd](self, args)
+                    result = self.net_cmd_dispatcher[cmd](self, args)
+                    if asyncio.iscoroutine(result):
+                        self.run_async(result)
                     if cmd != 'CH':
                         self.client.last_pkt_time = time()
                 except KeyError:
@@ -129,13 +202,75 @@ class AOProtocol(asyncio.Protocol):
         except ProtocolError:
             self.client.disconnect()
 
+    def run_async(self, coro):
+        """Runs a coroutine, holding back incoming messages until it
+        has finished.
+
+        :param coro: coroutine to run
+
+        """
+        self.pending_task = asyncio.ensure_future(coro)
+        self.pending_task.add_done_callback(self.async_done)
+
+    def async_done(self, task):
+        """Resumes processing of incoming messages after a coroutine
+        started by `run_async` has finished.
+
+        :param task: finished task
+
+        """
+        self.pending_task = None
+        if task.cancelled() or self.closed:
+            return
+        exc = task.exception()
+        if exc is not None:
+            logger_debug.error('Error in asynchronous handler', exc_info=exc)
+            self.transport.close()
+            return
+        self.process_messages()
+
     def connection_made(self, transport):
         """Called upon a new client connecting
 
         :param transport: the transport object
         """
+        self.transport = transport
+        self.run_async(self.create_client(transport))
+
+    async def create_client(self, transport):
+        """Checks a new connection against the IP range bans and the
+        admission limits, then resolves its IPID off the event loop and
+        creates its client.
+
+        :param transport: the transport object
+        """
+        peername = transport.get_extra_info('peername')[0]
+        asn = await self.server.get_asn_async(peername)
+        if self.closed:
+            return
         try:
-            self.client = self.server.new_client(transport)
+            self.server.check_ip_range_ban(transport, asn)
+        except ClientError:
+            transport.close()
+            return
+
+        admission = self.server.admission
+        if not await admission.admit(peername, asn):
+            transport.close()
+            return
+        self.handshaking = True
+        if self.closed:
+            self.end_handshake()
+            return
+        self.handshake_timeout = asyncio.get_event_loop().call_later(
+            admission.handshake_timeout, transport.close)
+
+        ipid = await database.ipid_async(peername)
+        if self.closed:
+            return
+
+        try:
+            self.client = self.server.new_client(transport, ipid)
         except ClientError:
             transport.close()
             return
@@ -155,12 +290,27 @@ class AOProtocol(asyncio.Protocol):
                                             'decryptor',
                                             34)  # just fantacrypt things)
 
+    def end_handshake(self):
+        """Gives back the handshake slot of the connection, if it holds
+        one."""
+        if not self.handshaking:
+            return
+        self.handshaking = False
+        self.server.admission.release()
+        if self.handshake_timeout is not None:
+            self.handshake_timeout.cancel()
+            self.handshake_timeout = None
+
     def connection_lost(self, exc):
         """User disconnected
 
         :param exc: reason
 
         """
+        self.closed = True
+        if self.pending_task is not None:
+            self.pending_task.cancel()
+        self.end_handshake()
         if self.client is not None:
             logger.debug(f'{self.client.ipid} disconnected.')
             self.server.remove_client(self.client)
@@ -170,43 +320,33 @@ class AOProtocol(asyncio.Protocol):
     def get_messages(self):
         """Parses out full messages from the buffer.
 
-        :return: yields messages
+        :return: list of messages
 
         """
         # Long header - not likely to be a valid message
-        if len(self.buffer) >= 24 and '#' not in self.buffer[:24]:
+        if self.framer.has_long_header():
             raise ProtocolError
 
-        while '#%' in self.buffer:
-            spl = self.buffer.split('#%', 1)
-            self.buffer = spl[1]
-            yield spl[0]
+        return self.framer.pop_messages()
 
-    def validate_net_cmd(self, args, *types, needs_auth=True):
-        """Makes sure the net command's arguments match expectations.
+    def validate_net_cmd(self, cmd, args, needs_auth=True):
+        """Makes sure the net command's arguments match one of the layouts
+        registered for the command in `net_cmd_schemas`.
 
+        :param cmd: name of the net command
         :param args: actual arguments to the net command
-        :param types: what kind of data types are expected
         :param needs_auth: whether you need to have chosen a character (Default value = True)
-        :param *types: list of types corresponding to each argument in the command
-        :returns: returns True if message was validated
+        :returns: list of parsed arguments if the message was validated, None otherwise
 
         """
         if needs_auth and self.client.char_id == -1:
-            return False
-        if len(args) != len(types):
-            return False
-        for i, arg in enumerate(args):
-            if len(str(arg)) == 0 and types[i] != self.ArgType.STR_OR_EMPTY:
-                return False
-            if types[i] == self.ArgType.INT:
-                try:
-                    args[i] = int(arg)
-                except ValueError:
-                    return False
-        return True
+            return None
+        validator = self.net_cmd_validators.get((cmd, len(args)))
+        if validator is None:
+            return None
+        return validator(args)
 
-    def net_cmd_hi(self, args):
+    async def net_cmd_hi(self, args):
         """Handshake.
 
         HI#<hdid:string>#%
@@ -218,13 +358,14 @@ class AOProtocol(asyncio.Protocol):
             self.client.disconnect()
             return
 
-        if not self.validate_net_cmd(args, self.ArgType.STR, needs_auth=False):
+        args = self.validate_net_cmd('HI', args, needs_auth=False)
+        if args is None:
             return
         hdid = self.client.hdid = args[0]
         ipid = self.client.ipid
 
-        database.add_hdid(ipid, hdid)
-        ban = database.find_ban(ipid, hdid)
+        ban = await database.check_connect(ipid, hdid)
+        self.end_handshake()
 
         if ban is not None:
             try:
@@ -271,14 +412,10 @@ class AOProtocol(asyncio.Protocol):
         """
         version = args[1].split(".")
         if len(version) <= 1:
-            self.client.release = args[1]
-        elif len(version) >= 2:
-            self.client.release = version[0]
-            self.client.major_version = version[1]
-        if len(version) >= 3:
-            self.client.minor_version = version[2]
-            
-        
+            self.client.set_version(args[1])
+        else:
+            self.client.set_version(*version[:3])
+
         self.client.send_command('FL', 'yellowtext', 'customobjections',
                                  'flipping', 'fastloading', 'noencryption',
                                  'deskmod', 'evidence', 'modcall_reason',
@@ -315,7 +452,7 @@ class AOProtocol(asyncio.Protocol):
 
         askchar2#%
         """
-        self.client.send_command('CI', *self.server.char_pages_ao1[0])
+        self.client.transport.write(self.server.char_pages_ao1_packets[0])
 
     def net_cmd_an(self, args):
         """Asks for specific pages of the character list.
@@ -323,13 +460,14 @@ class AOProtocol(asyncio.Protocol):
 
         AN#<page:int>#%
         """
-        if not self.validate_net_cmd(args, self.ArgType.INT, needs_auth=False):
+        args = self.validate_net_cmd('AN', args, needs_auth=False)
+        if args is None:
             return
-        if len(self.server.char_pages_ao1) > args[0] >= 0:
-            self.client.send_command('CI',
-                                     *self.server.char_pages_ao1[args[0]])
+        if len(self.server.char_pages_ao1_packets) > args[0] >= 0:
+            self.client.transport.write(
+                self.server.char_pages_ao1_packets[args[0]])
         else:
-            self.client.send_command('EM', *self.server.music_pages_ao1[0])
+            self.client.transport.write(self.server.music_pages_ao1_packets[0])
 
     def net_cmd_ae(self, _):
         """Asks for specific pages of the evidence list.
@@ -347,11 +485,12 @@ class AOProtocol(asyncio.Protocol):
         AM#<page:int>#%
 
         """
-        if not self.validate_net_cmd(args, self.ArgType.INT, needs_auth=False):
+        args = self.validate_net_cmd('AM', args, needs_auth=False)
+        if args is None:
             return
-        if len(self.server.music_pages_ao1) > args[0] >= 0:
-            self.client.send_command('EM',
-                                     *self.server.music_pages_ao1[args[0]])
+        if len(self.server.music_pages_ao1_packets) > args[0] >= 0:
+            self.client.transport.write(
+                self.server.music_pages_ao1_packets[args[0]])
         else:
             self.client.send_done()
             self.client.send_area_list()
@@ -363,13 +502,7 @@ class AOProtocol(asyncio.Protocol):
         AC#%
 
         """
-        for i, char in enumerate(self.server.char_list):
-            for esc in ESCAPE_CHARACTERS.keys():
-                if esc in char:
-                    char = char.replace(esc, ESCAPE_CHARACTERS[esc])
-            self.server.char_list[i] = char
-
-        self.client.send_command('SC', *self.server.char_list)
+        self.client.transport.write(self.server.char_list_packet)
 
     def net_cmd_rm(self, _):
         """Asks for the whole music list (AO2)
@@ -377,14 +510,7 @@ class AOProtocol(asyncio.Protocol):
         AM#%
 
         """
-
-        song_list = []
-        allowed = self.client in self.client.area.owners or self.client.is_mod
-        song_list += [a.name for a in self.server.area_manager.areas]
-
-        song_list += self.server.music_list_ao2
-
-        self.client.send_command('SM', *song_list)
+        self.client.transport.write(self.server.music_list_packet)
 
     def net_cmd_rd(self, _):
         """Asks for server metadata(charscheck, motd etc.) and a DONE#% signal(also best packet)
@@ -403,11 +529,8 @@ class AOProtocol(asyncio.Protocol):
         CC#<client_id:int>#<char_id:int>#<hdid:string>#%
 
         """
-        if not self.validate_net_cmd(args,
-                                     self.ArgType.INT,
-                                     self.ArgType.INT,
-                                     self.ArgType.STR,
-                                     needs_auth=False):
+        args = self.validate_net_cmd('CC', args, needs_auth=False)
+        if args is None:
             return
         elif not self.client.is_checked:
             return
@@ -445,53 +568,22 @@ class AOProtocol(asyncio.Protocol):
         additive = 0
         effect = ""
         pair_order = 0
-        if self.validate_net_cmd(args, self.ArgType.STR,  # msg_type
-                                 self.ArgType.STR_OR_EMPTY, self.ArgType.STR,   # pre, folder
-                                 self.ArgType.STR, self.ArgType.STR_OR_EMPTY,   # anim, text
-                                 self.ArgType.STR, self.ArgType.STR,            # pos, sfx
-                                 self.ArgType.INT, self.ArgType.INT,            # anim_type, cid
-                                 self.ArgType.INT, self.ArgType.INT_OR_STR,     # sfx_delay, button
-                                 self.ArgType.INT, self.ArgType.INT,            # evidence, flip
-                                 self.ArgType.INT, self.ArgType.INT,            # ding, color
-                                 ):
+        args = self.validate_net_cmd('MS', args)
+        if args is None:
+            return
+        elif len(args) == 15:
             # Pre-2.6 validation monstrosity.
             msg_type, pre, folder, anim, text, pos, sfx, anim_type, cid, sfx_delay, button, evidence, flip, ding, color = args
-        elif self.validate_net_cmd(
-            args, self.ArgType.STR, self.ArgType.STR_OR_EMPTY,              # msg_type, pre
-            self.ArgType.STR, self.ArgType.STR, self.ArgType.STR_OR_EMPTY,  # folder, anim, text
-            self.ArgType.STR, self.ArgType.STR, self.ArgType.INT,           # pos, sfx, anim_type
-            self.ArgType.INT, self.ArgType.INT, self.ArgType.INT_OR_STR,    # cid, sfx_delay, button
-            self.ArgType.INT, self.ArgType.INT, self.ArgType.INT,           # evidence, flip, ding
-            # color, showname, charid_pair
-            self.ArgType.INT, self.ArgType.STR_OR_EMPTY, self.ArgType.INT,
-            # offset_pair, nonint_pre
-            self.ArgType.STR, self.ArgType.INT,
-        ):
+        elif len(args) == 19:
             # 2.6 validation monstrosity.
             msg_type, pre, folder, anim, text, pos, sfx, anim_type, cid, sfx_delay, button, evidence, flip, ding, color, showname, charid_pair, offset_pair, nonint_pre = args
-        elif self.validate_net_cmd(
-            args, self.ArgType.STR, self.ArgType.STR_OR_EMPTY,              # msg_type, pre
-            self.ArgType.STR, self.ArgType.STR, self.ArgType.STR_OR_EMPTY,  # folder, anim, text
-            self.ArgType.STR, self.ArgType.STR, self.ArgType.INT,           # pos, sfx, anim_type
-            self.ArgType.INT, self.ArgType.INT, self.ArgType.INT_OR_STR,    # cid, sfx_delay, button
-            self.ArgType.INT, self.ArgType.INT, self.ArgType.INT,           # evidence, flip, ding
-            # color, showname, charid_pair
-            self.ArgType.INT, self.ArgType.STR_OR_EMPTY, self.ArgType.STR,
-            # offset_pair, nonint_pre, sfx_looping
-            self.ArgType.STR, self.ArgType.INT, self.ArgType.STR,
-            # screenshake, frames_shake, frames_realization
-            self.ArgType.INT, self.ArgType.STR, self.ArgType.STR,
-            # frames_sfx, additive, effect
-            self.ArgType.STR, self.ArgType.INT, self.ArgType.STR,
-        ):
+        else:
             # 2.8 validation monstrosity. (rip 2.7)
             msg_type, pre, folder, anim, text, pos, sfx, anim_type, cid, sfx_delay, button, evidence, flip, ding, color, showname, charid_pair, offset_pair, nonint_pre, sfx_looping, screenshake, frames_shake, frames_realization, frames_sfx, additive, effect = args
             pair_args = charid_pair.split("^")
             charid_pair = int(pair_args[0])
             if (len(pair_args) > 1):
                 pair_order = pair_args[1]
-        else:
-            return        
         
         if additive == 1 and self.client.area.client_can_additive(self.client):
             additive = 1
@@ -542,9 +634,8 @@ class AOProtocol(asyncio.Protocol):
                 return
         elif text.startswith('/s '): # Send a message to all areas client is CM in
             part = text.split(' ')
-            for a in self.server.area_manager.areas:
-                if self.client in a.owners:
-                    target_area.append(a.id)
+            for a in self.server.area_manager.get_owned_areas(self.client):
+                target_area.append(a.id)
             if not target_area:
                 self.client.send_ooc('You don\'t any areas!')
                 return
@@ -777,7 +868,8 @@ class AOProtocol(asyncio.Protocol):
         if self.client.is_ooc_muted:  # Checks to see if the client has been muted by a mod
             self.client.send_ooc('You are muted by a moderator.')
             return
-        if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.STR, needs_auth=False):
+        args = self.validate_net_cmd('CT', args, needs_auth=False)
+        if args is None:
             return
         if self.client.name != args[0] and self.client.fake_name != args[0]:
             if self.client.is_valid_name(args[0]):
@@ -872,11 +964,9 @@ class AOProtocol(asyncio.Protocol):
                 )
                 return
 
-            if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT):
-                if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT, self.ArgType.STR_OR_EMPTY):
-                    if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT, self.ArgType.STR_OR_EMPTY, self.ArgType.INT):
-                        if not self.validate_net_cmd(args, self.ArgType.STR, self.ArgType.INT, self.ArgType.STR_OR_EMPTY, self.ArgType.INT, self.ArgType.INT):
-                            return
+            args = self.validate_net_cmd('MC', args)
+            if args is None:
+                return
 
             if args[1] != self.client.char_id:
                 return
@@ -951,9 +1041,8 @@ class AOProtocol(asyncio.Protocol):
                 "You are not on the area's invite list, and thus, you cannot use the WTCE buttons!"
             )
             return
-        if not self.validate_net_cmd(
-                args, self.ArgType.STR) and not self.validate_net_cmd(
-                    args, self.ArgType.STR, self.ArgType.INT):
+        args = self.validate_net_cmd('RT', args)
+        if args is None:
             return
         if args[0] == 'testimony1':
             sign = 'WT'
@@ -1053,7 +1142,8 @@ class AOProtocol(asyncio.Protocol):
                 "You are not on the area's invite list, and thus, you cannot change the Confidence bars!"
             )
             return
-        if not self.validate_net_cmd(args, self.ArgType.INT, self.ArgType.INT):
+        args = self.validate_net_cmd('HP', args)
+        if args is None:
             return
         try:
             self.client.area.change_hp(args[0], args[1])
@@ -1073,7 +1163,8 @@ class AOProtocol(asyncio.Protocol):
         """
         if not self.client.is_checked:
             return
-        if not self.validate_net_cmd(args, self.ArgType.STR_OR_EMPTY, self.ArgType.STR_OR_EMPTY, self.ArgType.STR_OR_EMPTY):
+        args = self.validate_net_cmd('PE', args)
+        if args is None:
             return
         if len(args) < 3:
             return
@@ -1091,7 +1182,8 @@ class AOProtocol(asyncio.Protocol):
         """
         if not self.client.is_checked:
             return
-        if not self.validate_net_cmd(args, self.ArgType.INT):
+        args = self.validate_net_cmd('DE', args)
+        if args is None:
             return
         self.client.area.evi_list.del_evidence(
             self.client, self.client.evi_list[int(args[0])])
@@ -1106,7 +1198,8 @@ class AOProtocol(asyncio.Protocol):
         """
         if not self.client.is_checked:
             return
-        if not self.validate_net_cmd(args, self.ArgType.INT, self.ArgType.STR_OR_EMPTY, self.ArgType.STR_OR_EMPTY, self.ArgType.STR_OR_EMPTY):
+        args = self.validate_net_cmd('EE', args)
+        if args is None:
             return
         elif len(args) < 4:
             return
@@ -1177,6 +1270,58 @@ class AOProtocol(asyncio.Protocol):
         """
         self.net_cmd_ct(['opban', '/ban {}'.format(args[0])])
 
+    # Argument layouts accepted for each net command. A layout is picked
+    # by the number of arguments, so every layout of a command must have
+    # a distinct length.
+    net_cmd_schemas = {
+        'HI': [(ArgType.STR,)],  # hdid
+        'AN': [(ArgType.INT,)],  # page
+        'AM': [(ArgType.INT,)],  # page
+        'CC': [(ArgType.INT, ArgType.INT, ArgType.STR)],  # client_id, char_id, hdid
+        'MS': [
+            # Pre-2.6
+            (ArgType.STR, ArgType.STR_OR_EMPTY,              # msg_type, pre
+             ArgType.STR, ArgType.STR, ArgType.STR_OR_EMPTY, # folder, anim, text
+             ArgType.STR, ArgType.STR, ArgType.INT,          # pos, sfx, anim_type
+             ArgType.INT, ArgType.INT, ArgType.INT_OR_STR,   # cid, sfx_delay, button
+             ArgType.INT, ArgType.INT, ArgType.INT,          # evidence, flip, ding
+             ArgType.INT),                                   # color
+            # 2.6
+            (ArgType.STR, ArgType.STR_OR_EMPTY,              # msg_type, pre
+             ArgType.STR, ArgType.STR, ArgType.STR_OR_EMPTY, # folder, anim, text
+             ArgType.STR, ArgType.STR, ArgType.INT,          # pos, sfx, anim_type
+             ArgType.INT, ArgType.INT, ArgType.INT_OR_STR,   # cid, sfx_delay, button
+             ArgType.INT, ArgType.INT, ArgType.INT,          # evidence, flip, ding
+             ArgType.INT, ArgType.STR_OR_EMPTY, ArgType.INT, # color, showname, charid_pair
+             ArgType.STR, ArgType.INT),                      # offset_pair, nonint_pre
+            # 2.8
+            (ArgType.STR, ArgType.STR_OR_EMPTY,              # msg_type, pre
+             ArgType.STR, ArgType.STR, ArgType.STR_OR_EMPTY, # folder, anim, text
+             ArgType.STR, ArgType.STR, ArgType.INT,          # pos, sfx, anim_type
+             ArgType.INT, ArgType.INT, ArgType.INT_OR_STR,   # cid, sfx_delay, button
+             ArgType.INT, ArgType.INT, ArgType.INT,          # evidence, flip, ding
+             ArgType.INT, ArgType.STR_OR_EMPTY, ArgType.STR, # color, showname, charid_pair
+             ArgType.STR, ArgType.INT, ArgType.STR,          # offset_pair, nonint_pre, sfx_looping
+             ArgType.INT, ArgType.STR, ArgType.STR,          # screenshake, frames_shake, frames_realization
+             ArgType.STR, ArgType.INT, ArgType.STR),         # frames_sfx, additive, effect
+        ],
+        'CT': [(ArgType.STR, ArgType.STR)],  # name, message
+        'MC': [
+            (ArgType.STR, ArgType.INT),  # song_name, char_id
+            (ArgType.STR, ArgType.INT, ArgType.STR_OR_EMPTY),  # showname
+            (ArgType.STR, ArgType.INT, ArgType.STR_OR_EMPTY, ArgType.INT),  # effects
+            (ArgType.STR, ArgType.INT, ArgType.STR_OR_EMPTY, ArgType.INT,
+             ArgType.INT),
+        ],
+        'RT': [(ArgType.STR,), (ArgType.STR, ArgType.INT)],  # type, variant
+        'HP': [(ArgType.INT, ArgType.INT)],  # type, new_value
+        'PE': [(ArgType.STR_OR_EMPTY,) * 3],  # name, description, image
+        'DE': [(ArgType.INT,)],  # id
+        'EE': [(ArgType.INT, ArgType.STR_OR_EMPTY, ArgType.STR_OR_EMPTY,
+                ArgType.STR_OR_EMPTY)],  # id, name, description, image
+    }
+    net_cmd_validators = compile_validators(net_cmd_schemas)
+
     net_cmd_dispatcher = {
         'HI': net_cmd_hi,  # handshake
         'ID': net_cmd_id,  # client version
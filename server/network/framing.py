@@ -0,0 +1,90 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+from typing import List
+
+
+class AOFramer:
+    """Incrementally splits a byte stream into AO packets.
+
+    Incoming bytes are appended to a single buffer, and the search for
+    the `#%` delimiter resumes where the previous search left off, so
+    that data is never scanned twice no matter how it is segmented.
+    """
+    DELIMITER = b'#%'
+    # UTF-8 continuation bytes, which do not start a character
+    CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+
+    def __init__(self):
+        self.buffer = bytearray()
+        # Offset from which to resume the search for a delimiter
+        self.scan_pos = 0
+        # Number of characters in the buffer
+        self.char_count = 0
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def feed(self, data: bytes):
+        """Append received data to the buffer.
+
+        :param data: bytes of data
+
+        """
+        if b'\0' in data:
+            data = data.replace(b'\0', b'')
+        self.buffer += data
+        self.char_count += self.count_chars(data)
+
+    @classmethod
+    def count_chars(cls, data) -> int:
+        """Count the UTF-8 characters in some bytes, without decoding
+        them. Truncated characters are counted too.
+
+        :param data: bytes of data
+        :returns: number of bytes that start a character
+
+        """
+        return len(data.translate(None, cls.CONTINUATION_BYTES))
+
+    def has_long_header(self) -> bool:
+        """Whether or not the pending packet has a header too long
+        to be a valid message."""
+        return len(self.buffer) >= 24 and b'#' not in self.buffer[:24]
+
+    def pop_messages(self) -> List[str]:
+        """Remove all complete messages from the buffer.
+
+        :return: list of decoded messages, without their delimiter
+
+        """
+        buf = self.buffer
+        messages = []
+        start = 0
+        while True:
+            end = buf.find(self.DELIMITER, self.scan_pos)
+            if end == -1:
+                break
+            # try to decode as utf-8, ignore any erroneous characters
+            messages.append(buf[start:end].decode('utf-8', 'ignore'))
+            start = self.scan_pos = end + len(self.DELIMITER)
+        if start:
+            del buf[:start]
+            self.char_count = self.count_chars(buf)
+        # The last byte may be the first half of a delimiter
+        self.scan_pos = max(len(buf) - len(self.DELIMITER) + 1, 0)
+        return messages
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from server.network.admission import AdmissionController, TokenBucket
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=1, burst=2, now=0)
+    assert bucket.take(0)
+    assert bucket.take(0)
+    assert not bucket.take(0.5)
+    assert bucket.take(1.5)
+    assert not bucket.take(1.5)
+
+def test_rate_limits():
+    asns = {'10.0.0.1': '64500', '10.0.0.2': '64500', '10.0.0.3': '64501'}
+    admission = AdmissionController(ip_rate=0, ip_burst=2, asn_rate=0, asn_burst=3)
+    def check_rate(ip):
+        return admission.check_rate(ip, asns.get(ip))
+    assert check_rate('10.0.0.1')
+    assert check_rate('10.0.0.1')
+    assert not check_rate('10.0.0.1')
+    assert check_rate('10.0.0.2')
+    assert not check_rate('10.0.0.2')
+    assert check_rate('10.0.0.3')
+    # Addresses without a known ASN are only limited by IP
+    assert admission.check_rate('192.168.0.1')
+    stats = admission.stats()
+    assert stats['rejected_ip'] == 1
+    assert stats['rejected_asn'] == 1
+
+def test_handshake_slots():
+    async def check():
+        admission = AdmissionController(max_concurrent=1, queue_size=1,
+                                        queue_timeout=0.05)
+        assert await admission.admit('10.0.0.1')
+        waiting = asyncio.ensure_future(admission.admit('10.0.0.2'))
+        await asyncio.sleep(0)
+        # The queue is full
+        assert not await admission.admit('10.0.0.3')
+
+        admission.release()
+        assert await waiting
+        assert admission.active == 1
+
+        # Waiting connections give up after the deadline
+        assert not await admission.admit('10.0.0.4')
+        cancelled = asyncio.ensure_future(admission.admit('10.0.0.5'))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert not admission.waiters
+
+        admission.release()
+        assert admission.active == 0
+        assert admission.stats()['timed_out'] == 1
+    asyncio.run(check())
@@ -0,0 +1,19 @@
+from server.network.aoprotocol import AOProtocol, ArgType, compile_validator
+
+def test_compile_validator():
+    validator = compile_validator((ArgType.STR, ArgType.INT, ArgType.STR_OR_EMPTY))
+    assert validator(['a', '5', '']) == ['a', 5, '']
+    assert validator(['', '5', '']) is None
+    assert validator(['a', 'five', '']) is None
+
+def test_layout_by_arity():
+    validators = AOProtocol.net_cmd_validators
+    assert ('MS', 15) in validators
+    assert ('MS', 19) in validators
+    assert ('MS', 26) in validators
+    assert ('MS', 20) not in validators
+    args = ['chat', '-', 'Phoenix', 'normal', 'hi', 'def', '1', '0', '0',
+            '0', '0', '0', '0', '0', '0']
+    parsed = validators[('MS', 15)](args)
+    assert parsed[7:10] == [0, 0, 0]
+    assert args[7] == '0'
@@ -0,0 +1,31 @@
+from server.network.framing import AOFramer
+
+def test_pipelined_messages():
+    framer = AOFramer()
+    framer.feed(b'HI#abc#%ID#AO2#2.9.0#%CH')
+    assert framer.pop_messages() == ['HI#abc', 'ID#AO2#2.9.0']
+    framer.feed(b'ECK#%')
+    assert framer.pop_messages() == ['CHECK']
+    assert len(framer) == 0
+
+def test_split_delimiter_and_character():
+    framer = AOFramer()
+    data = 'CT#name#héllo#%'.encode('utf-8')
+    for i in range(len(data)):
+        framer.feed(data[i:i + 1])
+        messages = framer.pop_messages()
+    assert messages == ['CT#name#héllo']
+
+def test_strips_nul():
+    framer = AOFramer()
+    framer.feed(b'CH\0#\0%')
+    assert framer.pop_messages() == ['CH']
+
+def test_char_count():
+    framer = AOFramer()
+    data = 'CT#name#héllo#%CT#name#日本'.encode('utf-8')
+    framer.feed(data[:-1])
+    assert framer.char_count == 25
+    framer.feed(data[-1:])
+    assert framer.pop_messages() == ['CT#name#héllo']
+    assert framer.char_count == len('CT#name#日本')
@@ -0,0 +1,161 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from server import database
+from server.area_manager import AreaManager
+from server.client_manager import ClientManager
+from server.exceptions import AreaError
+
+def make_area(char_count):
+    server = SimpleNamespace(char_list=[f'char{i}' for i in range(char_count)],
+                             config={'testimony_limit': 30})
+    return AreaManager.Area(0, server, 'Lobby', 'default', False)
+
+def test_char_availability():
+    asyncio.run(check_char_availability())
+
+async def check_char_availability():
+    area = make_area(4)
+    for char_id in (-1, -1, 1, 2, 2):
+        area._take_char(char_id)
+    assert area.get_chars_check() == (0, -1, -1, 0)
+    assert area.chars_check_packet == b'CharsCheck#0#-1#-1#0#%'
+    assert not area.is_char_available(2)
+    assert area.get_rand_avail_char_id() in (0, 3)
+
+    area._release_char(2)
+    assert area.get_chars_check() == (0, -1, -1, 0)
+    area._release_char(2)
+    assert area.is_char_available(2)
+    assert area.get_chars_check() == (0, -1, 0, 0)
+
+    for char_id in (0, 2, 3):
+        area._take_char(char_id)
+    with pytest.raises(AreaError):
+        area.get_rand_avail_char_id()
+
+def test_coalesced_chars_check():
+    async def check():
+        area = make_area(4)
+        sent = []
+        class FakeClient:
+            def send_chars_check(self):
+                sent.append(area.get_chars_check())
+        area.clients.add(FakeClient())
+        for char_id in (-1, 0, 1, 2):
+            area._take_char(char_id)
+        area._release_char(0)
+        assert sent == []
+        await asyncio.sleep(0)
+        assert sent == [(0, -1, -1, 0)]
+
+        # Spectators do not change the list
+        area._take_char(-1)
+        await asyncio.sleep(0)
+        assert len(sent) == 1
+    asyncio.run(check())
+
+def make_manager(tmp_path, monkeypatch, area_count, **server_args):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'config').mkdir()
+    (tmp_path / 'config' / 'areas.yaml').write_text(''.join(
+        f'- {{area: Area {i}, background: default, bglock: false}}\n'
+        for i in range(area_count)))
+    server = SimpleNamespace(char_list=['char0'],
+                             config={'testimony_limit': 30, 'arup_interval': 0},
+                             **server_args)
+    server.area_manager = AreaManager(server)
+    return server.area_manager
+
+def test_arup_scheduler(tmp_path, monkeypatch):
+    async def check():
+        sent = []
+        manager = make_manager(tmp_path, monkeypatch, 2, send_arup=sent.append)
+
+        # Changes in the same window are sent once
+        manager.areas[0].change_status('casing')
+        manager.areas[1].change_status('rp')
+        manager.send_arup_players()
+        await asyncio.sleep(0)
+        assert sent == [[0, 0, 0], [1, 'CASING', 'RP']]
+
+        # Unchanged packets are skipped
+        manager.areas[1].change_status('idle')
+        manager.areas[1].change_status('rp')
+        manager.send_arup_players()
+        await asyncio.sleep(0)
+        assert len(sent) == 2
+
+        # A new client is sent everything without a broadcast
+        class FakeClient:
+            commands = []
+            def send_command(self, *args):
+                self.commands.append(args)
+        client = FakeClient()
+        manager.send_arup_snapshot(client)
+        await asyncio.sleep(0)
+        assert [args[1] for args in client.commands] == [0, 1, 2, 3]
+        assert len(sent) == 2
+    asyncio.run(check())
+
+def test_area_indexes(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, monkeypatch, 3, send_arup=lambda args: None)
+    assert manager.area_list_packet == b'FA#Area 0#Area 1#Area 2#%'
+    assert manager.get_area_by_id(2) is manager.areas[2]
+    assert manager.get_area_by_name('Area 1') is manager.areas[1]
+    with pytest.raises(AreaError):
+        manager.get_area_by_id(3)
+    with pytest.raises(AreaError):
+        manager.get_area_by_name('Area 3')
+
+    cm = object()
+    manager.areas[2].add_owner(cm)
+    manager.areas[0].add_owner(cm)
+    manager.areas[0].add_owner(cm)
+    assert manager.get_owned_areas(cm) == [manager.areas[0], manager.areas[2]]
+    manager.areas[0].remove_owner(cm)
+    assert manager.get_owned_areas(cm) == [manager.areas[2]]
+    manager.areas[2].clear_owners()
+    assert manager.areas[2].owners == []
+    assert manager.get_owned_areas(cm) == []
+    assert manager.owned_areas == {}
+
+def test_change_area_chars_check(tmp_path, monkeypatch):
+    async def check():
+        manager = make_manager(tmp_path, monkeypatch, 3, send_arup=lambda args: None)
+        monkeypatch.setattr(database, '_database_singleton',
+                            SimpleNamespace(log_room=lambda *args: None))
+        server = manager.server
+        floodguard = {'times_per_interval': 1, 'interval_length': 0, 'mute_length': 0}
+        server.config.update(hostname='tsuserver', playerlimit=10, multiclient_limit=10,
+                             music_change_floodguard=floodguard,
+                             wtce_floodguard=floodguard)
+        server.client_manager = ClientManager(server)
+
+        sent = []
+        class FakeTransport:
+            def write(self, data):
+                sent.append(data.decode('utf-8'))
+        def chars_checks():
+            return [packet for packet in sent if packet.startswith('CharsCheck#')]
+
+        client = ClientManager.Client(server, FakeTransport(), 0, 1)
+        client.area.new_client(client)
+        await asyncio.sleep(0)
+
+        # A spectator does not change the list of the new area
+        sent.clear()
+        client.change_area(manager.areas[1])
+        await asyncio.sleep(0)
+        assert chars_checks() == ['CharsCheck#0#%']
+
+        # A client with a character gets the area broadcast only
+        client.char_id = 0
+        await asyncio.sleep(0)
+        sent.clear()
+        client.change_area(manager.areas[2])
+        await asyncio.sleep(0)
+        assert chars_checks() == ['CharsCheck#-1#%']
+    asyncio.run(check())
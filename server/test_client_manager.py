@@ -0,0 +1,179 @@
+from types import SimpleNamespace
+
+import pytest
+
+from server.client_manager import ClientManager
+from server.constants import TargetType
+
+class FakeArea:
+    def __init__(self):
+        self.clients = set()
+        self.afkers = []
+        self.owners = []
+        self.jukebox = False
+
+    def change_client_char(self, client, old_char_id, new_char_id):
+        pass
+
+    def move_protocol_bucket(self, client, old_bucket):
+        pass
+
+class FakeTransport:
+    def __init__(self):
+        self.packets = []
+
+    def write(self, data):
+        self.packets.append(data.decode('utf-8'))
+
+@pytest.fixture
+def manager():
+    area = FakeArea()
+    floodguard = {'times_per_interval': 1, 'interval_length': 0, 'mute_length': 0}
+    server = SimpleNamespace(
+        char_list=['Phoenix', 'Phoenix_Casual', 'Edgeworth'],
+        config={'playerlimit': 100, 'multiclient_limit': 2,
+                'music_change_floodguard': floodguard,
+                'wtce_floodguard': floodguard},
+        area_manager=SimpleNamespace(default_area=lambda: area, areas=[area],
+                                     get_owned_areas=lambda client: []))
+    server.client_manager = ClientManager(server)
+    return server.client_manager
+
+def connect(manager, ipid):
+    client = manager.new_client(None, ipid)
+    client.area.clients.add(client)
+    return client
+
+def test_indexes(manager):
+    a = connect(manager, 1)
+    b = connect(manager, 1)
+    c = connect(manager, 2)
+    assert manager.connection_count(1) == 2
+    assert manager.new_client_preauth(a)
+    assert not manager.new_client_preauth(connect(manager, 1))
+
+    a.name = 'Phoenix'
+    a.hdid = 'abc'
+    assert manager.get_clients_by_name('phoenix') == {a}
+    assert not b.is_valid_name('Phoenix')
+    assert b.is_valid_name('Edgeworth')
+    a.name = 'Wright'
+    assert manager.get_clients_by_name('phoenix') == set()
+
+    assert manager.get_targets(c, TargetType.ID, b.id) == [b]
+    assert set(manager.get_targets(c, TargetType.IPID, 1)) == {a, b, manager.get_client_by_id(3)}
+    assert manager.get_targets(c, TargetType.HDID, 'abc') == [a]
+
+    manager.remove_client(a)
+    a.area.clients.discard(a)
+    assert manager.get_client_by_id(a.id) is None
+    assert manager.get_clients_by_hdid('abc') == set()
+    assert manager.get_clients_by_name('wright') == set()
+    assert manager.connection_count(1) == 2
+
+def test_prefix_targets(manager):
+    a = connect(manager, 10)
+    b = connect(manager, 11)
+    c = connect(manager, 123)
+    a.name = 'Nick'
+    b.name = 'Nicky'
+    a.char_id = 0
+    b.char_id = 1
+    c.char_id = 2
+
+    # Targets are clients whose key is a prefix of the value
+    targets = manager.get_targets(c, TargetType.OOC_NAME, 'nicky sorry')
+    assert set(targets) == {a, b}
+    assert manager.get_targets(c, TargetType.OOC_NAME, 'Nick') == [a]
+    assert manager.get_targets(c, TargetType.CHAR_NAME, 'phoenix_casual hi') == [a, b]
+    assert manager.get_targets(c, TargetType.CHAR_NAME, 'Spectator') == []
+    assert manager.get_targets(c, TargetType.IP, '123') == [c]
+    assert set(manager.get_targets(c, TargetType.ALL, 'Nicky')) == {a, b}
+
+    b.char_id = -1
+    assert manager.get_targets(c, TargetType.CHAR_NAME, 'phoenix_casual') == [a]
+    assert manager.get_targets(c, TargetType.CHAR_NAME, 'spectator') == [b]
+    manager.remove_client(b)
+    assert manager.get_targets(c, TargetType.OOC_NAME, 'nicky') == [a]
+
+def test_char_list_shrinks(manager):
+    a = connect(manager, 1)
+    b = connect(manager, 2)
+    a.char_id = 0
+    b.char_id = 2
+    changes = []
+    a.area.change_client_char = lambda client, old, new: changes.append((client, old, new))
+
+    manager.server.char_list = ['Phoenix', 'Maya']
+    manager.reindex_char_names()
+    assert a.char_id == 0
+    assert b.char_id == -1
+    # The character is freed in the area
+    assert changes == [(b, 2, -1)]
+    assert manager.get_targets(a, TargetType.CHAR_NAME, 'spectator') == [b]
+    assert manager.get_targets(a, TargetType.CHAR_NAME, 'edgeworth') == []
+
+def ms_args(evidence=0):
+    args = [str(i) for i in range(30)]
+    args[11] = evidence
+    args[19] = '10<and>20'
+    args[20] = '-5<and>3'
+    return tuple(args)
+
+def ms_packet(args):
+    return '#'.join(['MS', *map(str, args)]) + '#%'
+
+def connect_version(manager, ipid, major_version):
+    client = connect(manager, ipid)
+    client.transport = FakeTransport()
+    client.set_version('2', major_version, '0')
+    return client
+
+def test_broadcast_buckets(manager):
+    old = connect_version(manager, 1, '8')
+    new = connect_version(manager, 2, '9')
+    assert old.protocol_bucket and not new.protocol_bucket
+    args = ms_args()
+    manager.broadcast_command([old, new], 'MS', *args)
+
+    # <2.9 clients do not get the Y offsets
+    stripped = list(args)
+    stripped[19] = '10'
+    stripped[20] = '-5'
+    assert old.transport.packets == [ms_packet(stripped)]
+    assert new.transport.packets == [ms_packet(args)]
+
+    # Sending to a single client adapts the packet the same way
+    old.send_command('MS', *args)
+    assert old.transport.packets[-1] == ms_packet(stripped)
+    # Other commands are sent unchanged
+    manager.broadcast_command([old, new], 'CT', 'name', '10<and>20')
+    assert old.transport.packets[-1] == new.transport.packets[-1] == 'CT#name#10<and>20#%'
+
+def test_evidence_remap(manager):
+    a = connect_version(manager, 1, '9')
+    b = connect_version(manager, 2, '9')
+    c = connect_version(manager, 3, '9')
+    # Displayed index -> area evidence index
+    a.evi_list = [0, 3, 1]
+    b.evi_list = [0, 1, 3, 3]
+    assert a.get_evidence_num('MS', ms_args(3)) == 1
+    assert a.get_evidence_num('MS', ms_args(1)) == 2
+    # The first displayed index is used for duplicates
+    assert b.get_evidence_num('MS', ms_args(3)) == 2
+    # Evidence the client does not see is sent unchanged
+    assert a.get_evidence_num('MS', ms_args(7)) is None
+    assert a.get_evidence_num('CT', ms_args(3)) is None
+    assert a.get_evidence_num('MS', ('a',) * 5) is None
+
+    manager.broadcast_command([a, b, c], 'MS', *ms_args(3))
+    assert a.transport.packets == [ms_packet(ms_args(1))]
+    assert b.transport.packets == [ms_packet(ms_args(2))]
+    assert c.transport.packets == [ms_packet(ms_args(3))]
+
+    manager.broadcast_command([a, b], 'MS', *ms_args(42))
+    assert a.transport.packets[-1] == b.transport.packets[-1] == ms_packet(ms_args(42))
+
+    a.evi_list = [0, 1]
+    a.send_command('MS', *ms_args(1))
+    assert a.transport.packets[-1] == ms_packet(ms_args(1))
@@ -0,0 +1,34 @@
+from server import config_loader
+from server.config_loader import load_yaml
+
+def test_load_yaml(tmp_path, monkeypatch):
+    parsed = []
+    safe_load = config_loader.safe_load
+    def counting_load(data):
+        parsed.append(data)
+        return safe_load(data)
+    monkeypatch.setattr(config_loader, 'safe_load', counting_load)
+
+    music = tmp_path / 'music.yaml'
+    cache_dir = str(tmp_path / 'cache')
+    music.write_text('- category: ==Music==\n  songs:\n  - name: Trial.opus\n')
+    document = [{'category': '==Music==', 'songs': [{'name': 'Trial.opus'}]}]
+    assert load_yaml(str(music), cache_dir) == document
+    assert load_yaml(str(music), cache_dir) == document
+    assert len(parsed) == 1
+
+    # Documents are not shared between loads
+    load_yaml(str(music), cache_dir).append('changed')
+    assert load_yaml(str(music), cache_dir) == document
+
+    music.write_text('- category: ==More==\n')
+    assert load_yaml(str(music), cache_dir) == [{'category': '==More=='}]
+    assert len(parsed) == 2
+
+    # A damaged cache file is replaced
+    for cache_file in (tmp_path / 'cache').iterdir():
+        cache_file.write_bytes(b'garbage')
+    assert load_yaml(str(music), cache_dir) == [{'category': '==More=='}]
+    assert load_yaml(str(music), cache_dir) == [{'category': '==More=='}]
+    assert len(parsed) == 3
+    assert load_yaml(str(music), None) == [{'category': '==More=='}]
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import sqlite3
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from server import database
+from server.database import Database, EventLogWriter
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'storage').mkdir()
+    (tmp_path / 'migrations').symlink_to(
+        os.path.join(os.path.dirname(__file__), '..', 'migrations'))
+    db = Database()
+    yield db
+    db.close()
+
+def test_event_log_writer(tmp_path):
+    db_file = str(tmp_path / 'db.sqlite3')
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('CREATE TABLE events(id INTEGER PRIMARY KEY, msg TEXT NOT NULL)')
+    writer = EventLogWriter(db_file, flush_interval=60, batch_size=3)
+    for i in range(5):
+        writer.put('INSERT INTO events(msg) VALUES (?)', (str(i),))
+    writer.put('INSERT INTO events(msg) VALUES (?)', (None,))
+
+    # Flushing does not wait for the flush interval
+    start = time.monotonic()
+    writer.flush()
+    assert time.monotonic() - start < 10
+    with sqlite3.connect(db_file) as conn:
+        rows = conn.execute('SELECT msg FROM events ORDER BY id').fetchall()
+    assert [row[0] for row in rows] == ['0', '1', '2', '3', '4']
+
+    writer.put('INSERT INTO events(msg) VALUES (?)', ('5',))
+    writer.close()
+    writer.close()
+    stats = writer.stats()
+    assert stats['written'] == 6
+    assert stats['failed'] == 1
+    assert stats['pending'] == 0
+
+def test_event_log_writer_full(tmp_path):
+    db_file = str(tmp_path / 'db.sqlite3')
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('CREATE TABLE events(id INTEGER PRIMARY KEY, msg TEXT NOT NULL)')
+    writer = EventLogWriter(db_file, flush_interval=60, batch_size=1, max_size=2)
+    # Hold the writer up, so that the queue fills
+    lock = sqlite3.connect(db_file, isolation_level=None)
+    lock.execute('BEGIN EXCLUSIVE')
+    for i in range(10):
+        writer.put('INSERT INTO events(msg) VALUES (?)', (str(i),))
+    stats = writer.stats()
+    assert stats['enqueued'] + stats['dropped'] == 10
+    assert stats['dropped'] >= 7
+    lock.rollback()
+    lock.close()
+    writer.close()
+    assert writer.stats()['written'] == stats['enqueued']
+
+def test_subtype_atom_cache(db):
+    type_id = db._subtype_atom('misc', 'test')
+    assert db.subtype_atoms['misc']['test'] == type_id
+    db.load_subtype_atoms()
+    assert db._subtype_atom('misc', 'test') == type_id
+    assert db._subtype_atom('room', 'test') == db.subtype_atoms['room']['test']
+
+def test_check_connect_cache(db):
+    async def check():
+        ipid = await db.ipid_async('10.0.0.1')
+        assert ipid == db.ipid('10.0.0.1')
+        assert await db.check_connect(ipid, 'hdid') is None
+        assert '10.0.0.1' in db.ipid_cache
+        assert (ipid, 'hdid') in db.not_banned_cache
+
+        moderator = SimpleNamespace(name='mod', ipid=db.ipid('10.0.0.2'))
+        ban_id = db.ban(ipid, 'reason', banned_by=moderator)
+        assert (ipid, 'hdid') not in db.not_banned_cache
+        ban = await db.check_connect(ipid, 'hdid')
+        assert ban.ban_id == ban_id
+
+        db.unban(ban_id)
+        assert await db.check_connect(ipid, 'hdid') is None
+    asyncio.run(check())
+
+@pytest.mark.parametrize('sql', [
+    database.SQL_FIND_BAN,
+    database.SQL_LAST_KNOWN_NAME,
+    database.SQL_BAN_IPIDS,
+    database.SQL_BAN_HDIDS,
+    database.SQL_PENDING_UNBANS
+])
+def test_queries_use_indexes(db, sql):
+    plan = db.db.execute('EXPLAIN QUERY PLAN ' + sql,
+                         (1,) * sql.count('?')).fetchall()
+    for row in plan:
+        detail = row['detail']
+        # Scans of materialized subqueries are not table scans
+        if detail.startswith('SCAN') and 'subquery' not in detail:
+            pytest.fail(f'Full table scan: {detail}')
+        assert 'TEMP B-TREE FOR ORDER BY' not in detail
+
+def test_event_log_writer_failures(tmp_path):
+    # The writer cannot open its database
+    writer = EventLogWriter(str(tmp_path / 'missing' / 'db.sqlite3'))
+    writer.thread.join()
+    writer.put('INSERT INTO events(msg) VALUES (?)', ('0',))
+    writer.flush()
+    writer.close()
+
+    class BadParam:
+        def __len__(self):
+            raise RuntimeError('bad param')
+
+    db_file = str(tmp_path / 'db.sqlite3')
+    with sqlite3.connect(db_file) as conn:
+        conn.execute('CREATE TABLE events(id INTEGER PRIMARY KEY, msg TEXT NOT NULL)')
+    writer = EventLogWriter(db_file, flush_interval=60)
+    writer.put('INSERT INTO events(msg) VALUES (?)', BadParam())
+    writer.put('INSERT INTO events(msg) VALUES (?)', ('1',))
+    writer.flush()
+    # The writer is still running
+    writer.put('INSERT INTO events(msg) VALUES (?)', ('2',))
+    writer.flush()
+    stats = writer.stats()
+    assert stats['written'] == 2
+    assert stats['failed'] == 1
+    writer.close()
@@ -0,0 +1,67 @@
+import os
+
+from server.emotes import EmoteTables
+
+CHAR_INI = '''[Options]
+name = Phoenix
+
+[Emotions]
+number = 2
+1 = Normal#-#normal#0
+2 = Point#point#pointing#1
+
+[SoundN]
+1 = 1
+2 = sfx-objection
+'''
+
+def test_emote_tables(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'storage').mkdir()
+    ini = tmp_path / 'characters' / 'Phoenix' / 'char.ini'
+    ini.parent.mkdir(parents=True)
+    ini.write_text(CHAR_INI)
+
+    tables = EmoteTables(['Phoenix', 'Missing'])
+    assert tables.parsed == 0
+    assert tables['Phoenix'].validate('point', 'pointing', 'sfx-objection')
+    assert not tables['Phoenix'].validate('point', 'normal', None)
+    # Characters without an INI allow anything
+    assert tables['Missing'].validate('a', 'b', None)
+    assert tables.parsed == 2
+    tables.save()
+
+    # Unchanged files are read from the cache
+    tables = EmoteTables(['Phoenix'])
+    assert tables['Phoenix'].emotes == {('-', 'normal', None), ('point', 'pointing', 'sfx-objection'),
+                                        ('point', 'pointing', None)}
+    assert (tables.parsed, tables.cached) == (0, 1)
+
+    ini.write_text(CHAR_INI.replace('number = 2', 'number = 1'))
+    os.utime(ini, ns=(0, 0))
+    tables = EmoteTables(['Phoenix'])
+    assert not tables['Phoenix'].validate('point', 'pointing', None)
+    assert (tables.parsed, tables.cached) == (1, 0)
+
+def test_atoms_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    ini = tmp_path / 'characters' / 'Phoenix' / 'char.ini'
+    ini.parent.mkdir(parents=True)
+    ini.write_text(CHAR_INI)
+    other = tmp_path / 'characters' / 'Maya' / 'char.ini'
+    other.parent.mkdir(parents=True)
+    other.write_text(CHAR_INI.replace('point', 'think'))
+
+    tables = EmoteTables(['Phoenix', 'Maya'], cache_file=str(tmp_path / 'cache.json'))
+    assert tables['Phoenix'].atoms is tables['Maya'].atoms
+    assert ('point', 'pointing') in tables.atoms.pair_ids
+    # Another character list does not share the atoms
+    assert EmoteTables(['Phoenix']).atoms is not tables.atoms
+
+    ini.write_text(CHAR_INI.replace('point', 'slam'))
+    os.utime(ini, ns=(0, 0))
+    tables.invalidate('Phoenix')
+    assert ('point', 'pointing') not in tables.atoms.pair_ids
+    assert tables['Maya'].validate('think', 'thinking', 'sfx-objection')
+    assert tables['Phoenix'].validate('slam', 'slaming', None)
+    assert tables['Phoenix'].atoms is tables['Maya'].atoms
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from server.ipranges import IPRangeBans
+
+LINES = [
+    '# line 0',
+    '23.120.182.',
+    '104.244.7',
+    '10.0.0.0/8',
+    '10.1.0.0/16',
+    '192.0.2.1',
+    '2001:db8::/32',
+    '2001:db8:ffff::1',
+    '13335',
+    'AS64500',
+    'Loopback',
+    '',
+    '300.1.',
+    'not:an:address',
+]
+
+@pytest.fixture
+def bans():
+    return IPRangeBans.from_lines(LINES)
+
+@pytest.mark.parametrize('ip, ban_id', [
+    ('23.120.182.7', 1),
+    ('23.120.18.7', None),
+    ('104.244.7.1', 2),
+    ('104.244.75.1', 2),
+    ('104.244.8.1', None),
+    ('10.200.3.4', 3),
+    ('10.1.2.3', 3),
+    ('192.0.2.1', 5),
+    ('192.0.2.10', None),
+    ('::ffff:10.0.0.1', 3),
+    ('2001:db8:1::5', 6),
+    ('2001:db8:ffff::1', 6),
+    ('2001:db9::1', None),
+    ('not an ip', None),
+])
+def test_addresses(bans, ip, ban_id):
+    assert bans.match_address(ip) == ban_id
+
+def test_asns(bans):
+    assert bans.match('198.51.100.1', '13335') == 8
+    assert bans.match('198.51.100.1', '64500') == 9
+    assert bans.match('198.51.100.1', 'Loopback') == 10
+    assert bans.match('198.51.100.1', '64501') is None
+    # The lowest line wins when both the address and the ASN are banned
+    assert bans.match('10.0.0.1', '13335') == 3
+
+def test_invalid_lines(bans):
+    assert bans.match_address('300.1.0.1') is None
+    assert 'not:an:address' not in bans.asns
+    assert set(bans.asns) == {'13335', '64500', 'Loopback'}
+
+def test_sample_file():
+    path = os.path.join(os.path.dirname(__file__), '..', 'config_sample', 'iprange_ban.txt')
+    with open(path, encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    bans = IPRangeBans.from_lines(lines)
+    for ban_id, line in enumerate(lines):
+        if line and not line.startswith('#') and line.count('.') == 3 and line.endswith('.'):
+            assert bans.match_address(line + '1') == ban_id
@@ -0,0 +1,19 @@
+from server.trie import PrefixTrie
+
+def test_prefix_trie():
+    trie = PrefixTrie()
+    trie.add('ab', 1)
+    trie.add('abc', 2)
+    trie.add('b', 3)
+    assert trie.prefixes_of('abcd') == [1, 2]
+    assert trie.prefixes_of('a') == []
+
+    trie.add('b', 2)
+    assert trie.prefixes_of('abcd') == [1]
+    assert sorted(trie.prefixes_of('b')) == [2, 3]
+
+    trie.remove(1)
+    trie.remove(1)
+    assert trie.prefixes_of('abcd') == []
+    assert 'a' not in trie.root.children
+    assert len(trie) == 2
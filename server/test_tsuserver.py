@@ -0,0 +1,132 @@
+import asyncio
+from types import SimpleNamespace
+
+import geoip2.errors
+import pytest
+
+from server.cache import LRUCache
+from server.exceptions import ServerError
+from server.tsuserver import TsuServer3
+
+MUSIC_LIST = [
+    {'use_unique_folder': False},
+    {'category': '==Music==', 'songs': [
+        {'name': 'Trial.opus', 'length': 120},
+        {'name': 'Lobby.opus'}]},
+    {'category': '==More==', 'songs': [
+        {'name': 'Trial.opus', 'length': 60}]}
+]
+
+def test_music_index():
+    server = TsuServer3.__new__(TsuServer3)
+    server.music_list = MUSIC_LIST
+    server.music_index = server.build_music_index(MUSIC_LIST)
+
+    assert server.get_song_data(server.music_list, 'Trial.opus') == ('Trial.opus', 120)
+    assert server.get_song_data(server.music_list, 'Lobby.opus') == ('Lobby.opus', -1)
+    assert server.get_song_data(server.music_list, '==More==') == ('==More==', -1)
+    assert server.get_song_is_category(server.music_list, '==More==')
+    assert not server.get_song_is_category(server.music_list, 'Lobby.opus')
+    with pytest.raises(ServerError):
+        server.get_song_data(server.music_list, 'Missing.opus')
+
+    area_music = MUSIC_LIST[2:]
+    assert server.get_song_data(area_music, 'Trial.opus') == ('Trial.opus', 60)
+    assert not server.get_song_is_category(area_music, '==Music==')
+
+def test_asn_cache():
+    lookups = []
+    class FakeReader:
+        def asn(self, ip):
+            lookups.append(ip)
+            if ip == '127.0.0.1':
+                raise geoip2.errors.AddressNotFoundError(ip)
+            return SimpleNamespace(autonomous_system_number=64500)
+
+    server = TsuServer3.__new__(TsuServer3)
+    server.useGeoIp = True
+    server.geoIpReader = FakeReader()
+    server.asn_cache = LRUCache(16)
+
+    async def check():
+        assert await server.get_asn_async('10.0.0.1') == '64500'
+        assert server.get_asn('10.0.0.1') == '64500'
+        assert server.get_asn('127.0.0.1') is None
+        assert await server.get_asn_async('127.0.0.1') is None
+    asyncio.run(check())
+    assert lookups == ['10.0.0.1', '127.0.0.1']
+    assert server.asn_cache.hits == 2
+    assert server.asn_cache.misses == 2
+
+def test_describe_changes():
+    server = TsuServer3.__new__(TsuServer3)
+    server.config = {'motd': 'Welcome', 'modpass': 'secret'}
+    server.char_list = ['Phoenix', 'Edgeworth']
+    server.music_index = TsuServer3.build_music_index(MUSIC_LIST)
+    server.backgrounds = ['default']
+    server.allowed_iniswaps = []
+    state = {
+        'motd': 'Welcome',
+        'modpass': {'default': {'password': 'secret'}},
+        'char_list': ['Phoenix', 'Edgeworth'],
+        'music_index': TsuServer3.build_music_index(MUSIC_LIST),
+        'backgrounds': ['default']
+    }
+    assert server.describe_changes(state) == []
+
+    state['modpass'] = {'default': {'password': 'hunter2'},
+                        'trial': {'password': 'trial'}}
+    state['char_list'] = ['Phoenix', 'Maya']
+    state['music_index'] = TsuServer3.build_music_index(MUSIC_LIST[:2])
+    state['allowed_iniswaps'] = [['Phoenix', 'Maya']]
+    assert server.describe_changes(state) == [
+        'Moderator profiles: 1 added, 0 removed',
+        'Moderator profiles changed: default',
+        'Characters: 1 added, 1 removed',
+        'Music: 0 added, 1 removed',
+        'INI swap list changed'
+    ]
+
+def test_apply_changes_is_atomic():
+    server = TsuServer3.__new__(TsuServer3)
+    server.config = {'motd': 'Welcome', 'modpass': {}}
+    server.char_list = ['Phoenix']
+    server.char_emotes = None
+    def fail(char_list):
+        raise ValueError('bad index')
+    server.client_manager = SimpleNamespace(build_char_name_index=fail)
+
+    with pytest.raises(ValueError):
+        server.apply_changes({'motd': 'New', 'char_list': ['Maya']})
+    assert server.config['motd'] == 'Welcome'
+    assert server.char_list == ['Phoenix']
+
+def test_handshake_packets(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'config').mkdir()
+    chars = ['Phoenix', 'Ace#1'] + [f'Char{i}' for i in range(2, 11)]
+    (tmp_path / 'config' / 'characters.yaml').write_text(
+        ''.join(f"- '{char}'\n" for char in chars))
+    (tmp_path / 'config' / 'music.yaml').write_text(
+        '- {use_unique_folder: false}\n'
+        '- {category: ==Music==, songs: [{name: Trial.opus}, {name: Lobby.opus}]}\n')
+    server = TsuServer3.__new__(TsuServer3)
+    server.char_emotes = None
+    server.area_manager = SimpleNamespace(areas=[SimpleNamespace(name='Lobby')])
+
+    server.load_characters()
+    # Character names are escaped once
+    assert server.char_list[1] == 'Ace<num>1'
+    assert server.char_list_packet == \
+        ('SC#' + '#'.join(server.char_list) + '#%').encode('utf-8')
+    assert len(server.char_pages_ao1_packets) == 2
+    assert server.char_pages_ao1_packets[0].startswith(
+        b'CI#0#Phoenix&&0&&&0&#1#Ace<num>1&&0&&&0&#')
+    assert server.char_pages_ao1_packets[1] == b'CI#10#Char10&&0&&&0&#%'
+
+    server.load_music()
+    assert server.music_list_packet == \
+        b'SM#Lobby#==Music==#Trial.opus#Lobby.opus#%'
+    assert server.music_list_ao2_packet == b'FM#==Music==#Trial.opus#Lobby.opus#%'
+    assert server.music_pages_ao1_packets == \
+        [b'EM#0#==Music==#1#Trial.opus#2#Lobby.opus#%']
@@ -0,0 +1,28 @@
+import os
+
+from server.watcher import FileWatcher
+
+def test_changes(tmp_path):
+    music = tmp_path / 'music.yaml'
+    music.write_text('[]')
+    (tmp_path / 'Phoenix').mkdir()
+    watcher = FileWatcher([str(music), str(tmp_path / '*' / 'char.ini')])
+    assert watcher.changes(watcher.scan()) == {}
+
+    music.write_text('[{category: ==Music==}]')
+    ini = tmp_path / 'Phoenix' / 'char.ini'
+    ini.write_text('[Options]')
+    assert watcher.changes(watcher.scan()) == {
+        str(music): {str(music)},
+        str(tmp_path / '*' / 'char.ini'): {str(ini)}
+    }
+    assert watcher.changes(watcher.scan()) == {}
+
+    # Same size, new modification time
+    stat = os.stat(ini)
+    os.utime(ini, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    music.unlink()
+    assert watcher.changes(watcher.scan()) == {
+        str(music): {str(music)},
+        str(tmp_path / '*' / 'char.ini'): {str(ini)}
+    }
@@ -0,0 +1,100 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+
+class PrefixTrie:
+    """Maps string keys to sets of values, and finds the values of
+    every key that is a prefix of a given string.
+
+    Each value is stored under a single key at a time, so that adding it
+    again under another key moves it.
+    """
+
+    class Node:
+        __slots__ = ('children', 'values')
+
+        def __init__(self):
+            self.children = {}
+            self.values = set()
+
+    def __init__(self):
+        self.root = self.Node()
+        # Current key of each value
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, value):
+        return value in self.keys
+
+    def add(self, key: str, value):
+        """Store a value under a key, removing it from its previous key.
+
+        :param key: key to store the value under
+        :param value: hashable value
+
+        """
+        if value in self.keys:
+            if self.keys[value] == key:
+                return
+            self.remove(value)
+        node = self.root
+        for char in key:
+            child = node.children.get(char)
+            if child is None:
+                child = node.children[char] = self.Node()
+            node = child
+        node.values.add(value)
+        self.keys[value] = key
+
+    def remove(self, value):
+        """Remove a value, pruning nodes that are left empty.
+
+        :param value: value to remove
+
+        """
+        key = self.keys.pop(value, None)
+        if key is None:
+            return
+        path = [self.root]
+        for char in key:
+            path.append(path[-1].children[char])
+        path[-1].values.discard(value)
+        for i in range(len(key), 0, -1):
+            node = path[i]
+            if node.values or node.children:
+                break
+            del path[i - 1].children[key[i - 1]]
+
+    def prefixes_of(self, string: str) -> list:
+        """Find the values of all keys that are a prefix of a string.
+        This takes time proportional to the length of the string and
+        the number of matches.
+
+        :param string: string to match
+        :returns: list of values, with the shortest keys first
+
+        """
+        node = self.root
+        matches = list(node.values)
+        for char in string:
+            node = node.children.get(char)
+            if node is None:
+                break
+            matches.extend(node.values)
+        return matches
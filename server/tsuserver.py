@@ -15,26 +15,45 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import os
 import sys
+import time
 import importlib
 import asyncio
 import websockets
 import geoip2.database
+import maxminddb
 import yaml
 import logging
 
 import server.logger
 from server import database
 from server.area_manager import AreaManager
+from server.cache import LRUCache
 from server.client_manager import ClientManager
-from server.emotes import Emotes
+from server.config_loader import load_yaml
+from server.constants import ESCAPE_CHARACTERS
+from server.emotes import EmoteTables
 from server.exceptions import ClientError,ServerError
+from server.ipranges import IPRangeBans
+from server.network.admission import AdmissionController
 from server.network.aoprotocol import AOProtocol
 from server.network.aoprotocol_ws import new_websocket_client
 from server.network.masterserverclient import MasterServerClient
+from server.watcher import FileWatcher
 
 logger = logging.getLogger('debug')
 
+_MISSING = object()
+
+# Ways of opening the GeoIP database (see maxminddb.open_database)
+GEOIP_MODES = {
+    'auto': maxminddb.MODE_AUTO,
+    'mmap': maxminddb.MODE_MMAP,
+    'memory': maxminddb.MODE_MEMORY,
+    'file': maxminddb.MODE_FILE
+}
+
 class TsuServer3:
     """The main class for tsuserver3 server software."""
     def __init__(self):
@@ -51,31 +70,45 @@ class TsuServer3:
         self.music_list = []
         self.music_list_ao2 = None
         self.music_pages_ao1 = None
+        # Encoded handshake packets, shared by every client
+        self.char_list_packet = None
+        self.char_pages_ao1_packets = None
+        self.music_list_packet = None
+        self.music_list_ao2_packet = None
+        self.music_pages_ao1_packets = None
+        # Track name -> (is category, length) for the server music list
+        self.music_index = {}
         self.bglock = False
         self.backgrounds = None
         self.zalgo_tolerance = None
-        self.ipRange_bans = []
+        self.ipRange_bans = IPRangeBans()
         self.geoIpReader = None
         self.useGeoIp = False
-
-        try:
-            self.geoIpReader = geoip2.database.Reader('./storage/GeoLite2-ASN.mmdb')
-            self.useGeoIp = True
-            # on debian systems you can use /usr/share/GeoIP/GeoIPASNum.dat if the geoip-database-extra package is installed
-        except FileNotFoundError:
-            self.useGeoIp = False
-            pass
+        # IP address -> ASN, or None if unknown
+        self.asn_cache = LRUCache(0)
 
         self.ms_client = None
-
+        # Seconds taken to load the configuration at startup
+        self.load_time = None
+        # Whether a refresh is being read in a worker thread
+        self.refreshing = False
+        # Number of refreshes applied
+        self.refreshes = 0
+
+        start_time = time.perf_counter()
         try:
             self.load_config()
+            self.load_geoip()
+            database.configure(self.config['database'])
+            self.admission = AdmissionController(
+                **self.config['handshake_admission'])
             self.area_manager = AreaManager(self)
             self.load_iniswaps()
             self.load_characters()
             self.load_music()
             self.load_backgrounds()
             self.load_ipranges()
+            self.load_time = time.perf_counter() - start_time
         except yaml.YAMLError as exc:
             print('There was a syntax error parsing a configuration file:')
             print(exc)
@@ -122,11 +155,14 @@ class TsuServer3:
         if self.config['idle_timeout']['use_idle_timeout']:
             asyncio.ensure_future(self.idle_loop())
 
+        if self.config['config_watcher'].get('enabled', False):
+            asyncio.ensure_future(self.watch_loop())
+
         asyncio.ensure_future(self.schedule_unbans())
 
         database.log_misc('start')
-        print('Server started and is listening on port {}'.format(
-            self.config['port']))
+        print('Server started and is listening on port {} (loaded in {:.0f} ms)'.format(
+            self.config['port'], self.load_time * 1000))
 
         try:
             loop.run_forever()
@@ -136,7 +172,15 @@ class TsuServer3:
         database.log_misc('stop')
 
         ao_server.close()
+        for client in list(self.client_manager.clients):
+            client.disconnect()
         loop.run_until_complete(ao_server.wait_closed())
+        # Let the connections be torn down, so that their area-leave and
+        # disconnect events are logged before the log writer is closed
+        loop.run_until_complete(asyncio.sleep(0.1))
+
+        database.close()
+        self.char_emotes.save()
         loop.close()
 
     async def schedule_unbans(self):
@@ -149,42 +193,157 @@ class TsuServer3:
             self.client_manager.check_idlers()
             await asyncio.sleep(60)
 
+    async def watch_loop(self):
+        """
+        Reload config files as soon as they are changed, rebuilding only
+        what is read from them.
+        """
+        loop = asyncio.get_event_loop()
+        interval = self.config['config_watcher'].get('interval', 2)
+        readers = {
+            'config/config.yaml': self.read_config,
+            'config/characters.yaml': self.read_characters,
+            'config/music.yaml': self.read_music,
+            'config/backgrounds.yaml': self.read_backgrounds,
+            'config/iniswaps.yaml': self.read_iniswaps,
+            'config/iprange_ban.txt': self.read_ipranges
+        }
+        char_inis = os.path.join(self.char_emotes.CHAR_DIR, '*', 'char.ini')
+        watcher = await loop.run_in_executor(
+            None, FileWatcher, [*readers, char_inis])
+        refreshes = self.refreshes
+        while True:
+            await asyncio.sleep(interval)
+            # /refresh reloads everything anyway
+            if self.refreshing:
+                continue
+            try:
+                stamps = await loop.run_in_executor(None, watcher.scan)
+                if refreshes != self.refreshes:
+                    # Do not reload the files that /refresh just reloaded
+                    refreshes = self.refreshes
+                    watcher.stamps = stamps
+                    continue
+                changed = watcher.changes(stamps)
+            except Exception:
+                logger.exception('Could not scan config files')
+                continue
+            for pattern, paths in changed.items():
+                try:
+                    if pattern == char_inis:
+                        for path in paths:
+                            self.char_emotes.invalidate(
+                                os.path.basename(os.path.dirname(path)))
+                        logger.info(
+                            f'Reloading emotes of {len(paths)} characters')
+                        continue
+                    state = await loop.run_in_executor(None, readers[pattern])
+                    changes = self.apply_changes(state)
+                except Exception:
+                    logger.exception(f'Could not reload {pattern}')
+                    continue
+                logger.info(f'Reloaded {pattern}: ' +
+                            (', '.join(changes) if changes else 'no changes'))
+            if changed:
+                try:
+                    self.char_emotes.save()
+                except Exception:
+                    logger.exception('Could not save the emote cache')
+
     @property
     def version(self):
         """Get the server's current version."""
         return f'{self.release}.{self.major_version}.{self.minor_version}'
 
-    def new_client(self, transport):
+    def load_geoip(self):
+        """Open the GeoIP ASN database, if there is one."""
+        options = self.config['geoip']
+        mode = options.get('mode', 'auto')
+        if mode not in GEOIP_MODES:
+            raise ServerError(f'Invalid GeoIP mode: {mode}')
+        self.asn_cache = LRUCache(options.get('cache_size', 4096))
+        try:
+            self.geoIpReader = geoip2.database.Reader(
+                './storage/GeoLite2-ASN.mmdb', mode=GEOIP_MODES[mode])
+            self.useGeoIp = True
+            # on debian systems you can use /usr/share/GeoIP/GeoIPASNum.dat if the geoip-database-extra package is installed
+        except FileNotFoundError:
+            self.useGeoIp = False
+
+    def lookup_asn(self, ip):
         """
-        Create a new client based on a raw transport by passing
-        it to the client manager.
+        Look up the autonomous system of an IP address in the GeoIP
+        database, bypassing the cache.
+        :param ip: IP address
+        :returns: ASN as a string, or None if unknown
+        """
+        try:
+            return str(self.geoIpReader.asn(ip).autonomous_system_number)
+        except geoip2.errors.AddressNotFoundError:
+            return None
+
+    def get_asn(self, ip):
+        """
+        Get the autonomous system of an IP address.
+        :param ip: IP address
+        :returns: ASN as a string, or None if unknown or GeoIP is not in use
+        """
+        if not self.useGeoIp:
+            return None
+        asn = self.asn_cache.get(ip, _MISSING)
+        if asn is _MISSING:
+            asn = self.lookup_asn(ip)
+            self.asn_cache.put(ip, asn)
+        return asn
+
+    async def get_asn_async(self, ip):
+        """
+        Get the autonomous system of an IP address, looking it up in a
+        worker thread if it is not cached.
+        :param ip: IP address
+        :returns: ASN as a string, or None if unknown or GeoIP is not in use
+        """
+        if not self.useGeoIp:
+            return None
+        asn = self.asn_cache.get(ip, _MISSING)
+        if asn is _MISSING:
+            asn = await asyncio.get_event_loop().run_in_executor(
+                None, self.lookup_asn, ip)
+            self.asn_cache.put(ip, asn)
+        return asn
+
+    def check_ip_range_ban(self, transport, asn):
+        """
+        Refuse a connection if its address is in a banned IP range or ASN.
         :param transport: asyncio transport
-        :returns: created client object
+        :param asn: ASN of the address, as from `get_asn`
+        :raises: ClientError if the address is banned
         """
         peername = transport.get_extra_info('peername')[0]
 
-        if self.useGeoIp:
-            try:
-                geoIpResponse = self.geoIpReader.asn(peername)
-                asn = str(geoIpResponse.autonomous_system_number)
-            except geoip2.errors.AddressNotFoundError:
-                asn = "Loopback"
-                pass
-        else:
+        if asn is None:
             asn = "Loopback"
 
-        for line,rangeBan in enumerate(self.ipRange_bans):
-            if rangeBan != "" and peername.startswith(rangeBan) or asn == rangeBan:
-                msg =   'BD#'
-                msg +=  'Abuse\r\n'
-                msg += f'ID: {line}\r\n'
-                msg +=  'Until: N/A'
-                msg +=  '#%'
+        line = self.ipRange_bans.match(peername, asn)
+        if line is not None:
+            msg =   'BD#'
+            msg +=  'Abuse\r\n'
+            msg += f'ID: {line}\r\n'
+            msg +=  'Until: N/A'
+            msg +=  '#%'
 
-                transport.write(msg.encode('utf-8'))
-                raise ClientError
+            transport.write(msg.encode('utf-8'))
+            raise ClientError
 
-        c = self.client_manager.new_client(transport)
+    def new_client(self, transport, ipid):
+        """
+        Create a new client based on a raw transport by passing
+        it to the client manager.
+        :param transport: asyncio transport
+        :param ipid: IPID of the address of the client
+        :returns: created client object
+        """
+        c = self.client_manager.new_client(transport, ipid)
         c.server = self
         c.area = self.area_manager.default_area()
         c.area.new_client(c)
@@ -208,9 +367,8 @@ class TsuServer3:
     def load_config(self):
         """Load the main server configuration from a YAML file."""
         try:
-            with open('config/config.yaml', 'r', encoding='utf-8') as cfg:
-                self.config = yaml.safe_load(cfg)
-                self.config['motd'] = self.config['motd'].replace('\\n', ' \n')
+            self.config = load_yaml('config/config.yaml')
+            self.config['motd'] = self.config['motd'].replace('\\n', ' \n')
         except OSError:
             print('error: config/config.yaml wasn\'t found.')
             print('You are either running from the wrong directory, or')
@@ -249,57 +407,153 @@ class TsuServer3:
             self.config['default_ban_duration'] = '6 hours'
         if 'asset_url' not in self.config:
             self.config['asset_url'] = None
+        if 'arup_interval' not in self.config:
+            self.config['arup_interval'] = 0.1
+        if 'database' not in self.config:
+            self.config['database'] = {}
+        if 'handshake_admission' not in self.config:
+            self.config['handshake_admission'] = {}
+        if 'geoip' not in self.config:
+            self.config['geoip'] = {}
+        if 'config_watcher' not in self.config:
+            self.config['config_watcher'] = {}
+
+    def apply_state(self, state):
+        """
+        Replace parts of the server state with newly loaded ones.
+        Emote tables read by the previous character list are kept.
+        :param state: dict of attribute name -> value, as built by the
+            read_* methods
+        """
+        new_emotes = state.get('char_emotes')
+        if new_emotes is not None and self.char_emotes is not None:
+            new_emotes.inherit(self.char_emotes)
+        for attr, value in state.items():
+            setattr(self, attr, value)
 
     def load_characters(self):
         """Load the character list from a YAML file."""
-        with open('config/characters.yaml', 'r', encoding='utf-8') as chars:
-            self.char_list = yaml.safe_load(chars)
-        self.build_char_pages_ao1()
-        self.char_emotes = {char: Emotes(char) for char in self.char_list}
+        self.apply_state(self.read_characters())
+
+    def read_characters(self):
+        """
+        Read the character list from a YAML file, and build what is
+        derived from it.
+        :returns: dict of attribute name -> value
+        """
+        encode_command = ClientManager.Client.encode_command
+        char_list = load_yaml('config/characters.yaml')
+        # Emote tables are read on first use
+        char_emotes = EmoteTables(char_list)
+        for i, char in enumerate(char_list):
+            for esc in ESCAPE_CHARACTERS.keys():
+                if esc in char:
+                    char = char.replace(esc, ESCAPE_CHARACTERS[esc])
+            char_list[i] = char
+        char_pages_ao1 = self.build_char_pages_ao1(char_list)
+        return {
+            'char_list': char_list,
+            'char_emotes': char_emotes,
+            'char_pages_ao1': char_pages_ao1,
+            'char_list_packet': encode_command('SC', *char_list),
+            'char_pages_ao1_packets': [
+                encode_command('CI', *page) for page in char_pages_ao1
+            ]
+        }
 
     def load_music(self):
-        self.build_music_list()
-        self.music_pages_ao1 = self.build_music_pages_ao1(self.music_list)
-        self.music_list_ao2 = self.build_music_list_ao2(self.music_list)
+        """
+        Load the music list, and replace it and everything built from it
+        at once, so that MC packets never see a partial list.
+        """
+        self.apply_state(self.read_music())
+
+    def read_music(self):
+        """
+        Read the music list from a YAML file, and build what is derived
+        from it.
+        :returns: dict of attribute name -> value
+        """
+        encode_command = ClientManager.Client.encode_command
+        music_list = self.build_music_list()
+        music_pages_ao1 = self.build_music_pages_ao1(music_list)
+        music_list_ao2 = self.build_music_list_ao2(music_list)
+        area_names = [area.name for area in self.area_manager.areas]
+        return {
+            'music_list': music_list,
+            'music_pages_ao1': music_pages_ao1,
+            'music_list_ao2': music_list_ao2,
+            'music_index': self.build_music_index(music_list),
+            'music_list_packet': encode_command('SM', *area_names, *music_list_ao2),
+            'music_list_ao2_packet': encode_command('FM', *music_list_ao2),
+            'music_pages_ao1_packets': [
+                encode_command('EM', *page) for page in music_pages_ao1
+            ]
+        }
 
     def load_backgrounds(self):
         """Load the backgrounds list from a YAML file."""
-        with open('config/backgrounds.yaml', 'r', encoding='utf-8') as bgs:
-            self.backgrounds = yaml.safe_load(bgs)
+        self.apply_state(self.read_backgrounds())
+
+    def read_backgrounds(self):
+        """
+        Read the backgrounds list from a YAML file.
+        :returns: dict of attribute name -> value
+        """
+        return {'backgrounds': load_yaml('config/backgrounds.yaml')}
 
     def load_iniswaps(self):
         """Load a list of characters for which INI swapping is allowed."""
+        self.apply_state(self.read_iniswaps())
+
+    def read_iniswaps(self):
+        """
+        Read the list of characters for which INI swapping is allowed.
+        :returns: dict of attribute name -> value, empty if there is no list
+        """
         try:
-            with open('config/iniswaps.yaml', 'r',
-                      encoding='utf-8') as iniswaps:
-                self.allowed_iniswaps = yaml.safe_load(iniswaps)
-        except:
+            return {'allowed_iniswaps': load_yaml('config/iniswaps.yaml')}
+        except OSError:
             logger.debug('Cannot find iniswaps.yaml')
+            return {}
 
     def load_ipranges(self):
-        """Load a list of banned IP ranges."""
+        """Load a list of banned IP ranges and ASNs."""
+        self.apply_state(self.read_ipranges())
+
+    def read_ipranges(self):
+        """
+        Read the list of banned IP ranges and ASNs.
+        :returns: dict of attribute name -> value, empty if there is no list
+        """
         try:
             with open('config/iprange_ban.txt', 'r',
                       encoding='utf-8') as ipranges:
-                self.ipRange_bans = ipranges.read().splitlines()
-        except:
+                return {'ipRange_bans': IPRangeBans.from_lines(
+                    ipranges.read().splitlines())}
+        except OSError:
             logger.debug('Cannot find iprange_ban.txt')
+            return {}
 
-    def build_char_pages_ao1(self):
+    @staticmethod
+    def build_char_pages_ao1(char_list):
         """
-        Cache a list of characters that can be used for the
-        AO1 connection handshake.
+        Build the pages of the character list for the AO1 connection
+        handshake.
+        :param char_list: character list
+        :returns: list of pages of 10 characters
         """
-        self.char_pages_ao1 = [
-            self.char_list[x:x + 10] for x in range(0, len(self.char_list), 10)
+        char_pages_ao1 = [
+            char_list[x:x + 10] for x in range(0, len(char_list), 10)
         ]
-        for i in range(len(self.char_list)):
-            self.char_pages_ao1[i // 10][i % 10] = '{}#{}&&0&&&0&'.format(
-                i, self.char_list[i])
+        for i in range(len(char_list)):
+            char_pages_ao1[i // 10][i % 10] = '{}#{}&&0&&&0&'.format(
+                i, char_list[i])
+        return char_pages_ao1
 
     def build_music_list(self):
-        with open('config/music.yaml', 'r', encoding='utf-8') as music:
-            self.music_list = yaml.safe_load(music)
+        """Read the music list from a YAML file."""
+        return load_yaml('config/music.yaml')
 
     def build_music_pages_ao1(self, music_list):
         song_list = []
@@ -331,6 +585,34 @@ class TsuServer3:
                     logger.debug(f"{song['name']} is not a valid song name")
         return song_list
 
+    @staticmethod
+    def build_music_index(music_list):
+        """
+        Index the categories and tracks of a music list by name.
+        When a name appears more than once, the first one is used.
+        :param music_list: music list to index
+        :returns: dict of name -> tuple (is category, length or -1)
+        """
+        index = {}
+        for item in music_list:
+            if 'category' not in item: #skip settings n stuff
+                continue
+            index.setdefault(item['category'], (True, -1))
+            for song in item['songs']:
+                index.setdefault(song['name'], (False, song.get('length', -1)))
+        return index
+
+    def get_music_index(self, music_list):
+        """
+        Get the index of a music list. Only the index of the server
+        music list is kept; other lists are indexed on each call.
+        :param music_list: music list
+        :returns: dict of name -> tuple (is category, length or -1)
+        """
+        if music_list is self.music_list:
+            return self.music_index
+        return self.build_music_index(music_list)
+
     @staticmethod
     def _is_valid_song_name(song_name: str) -> bool:
         return '.' in song_name
@@ -364,18 +646,11 @@ class TsuServer3:
         :returns: tuple (name, length or -1)
         :raises: ServerError if track not found
         """
-        for item in music_list:
-            if 'category' not in item: #skip settings n stuff
-                continue
-            if item['category'] == music:
-                return item['category'], -1
-            for song in item['songs']:
-                if song['name'] == music:
-                    try:
-                        return song['name'], song['length']
-                    except KeyError:
-                        return song['name'], -1
-        raise ServerError('Music not found.')
+        try:
+            _, length = self.get_music_index(music_list)[music]
+        except KeyError:
+            raise ServerError('Music not found.')
+        return music, length
 
     def get_song_is_category(self, music_list, music):
         """
@@ -384,21 +659,16 @@ class TsuServer3:
         :param music: track name
         :returns: bool
         """
-        for item in music_list:
-            if 'category' not in item: #skip settings n stuff
-                continue
-            if item['category'] == music:
-                return True
-        return False
+        is_category, _ = self.get_music_index(music_list).get(music, (False, -1))
+        return is_category
     
     def send_all_cmd_pred(self, cmd, *args, pred=lambda x: True):
         """
         Broadcast an AO-compatible command to all clients that satisfy
         a predicate.
         """
-        for client in self.client_manager.clients:
-            if pred(client):
-                client.send_command(cmd, *args)
+        self.client_manager.broadcast_command(
+            filter(pred, self.client_manager.clients), cmd, *args)
 
     def broadcast_global(self, client, msg, as_mod=False):
         """
@@ -496,21 +766,130 @@ class TsuServer3:
          - Backgrounds
          - Commands
          - Banlists
+         - Event type IDs
+        Nothing is changed if any of the files cannot be read.
+        :returns: list of changes, as from `describe_changes`
         """
-        with open('config/config.yaml', 'r') as cfg:
-            cfg_yaml = yaml.safe_load(cfg)
-            self.config['motd'] = cfg_yaml['motd'].replace('\\n', ' \n')
+        return self.apply_refresh(self.read_refresh())
 
-            # Reload moderator passwords list and unmod any moderator affected by
-            # credential changes or removals
+    async def read_refresh_async(self):
+        """
+        Read and build everything that is refreshed like `read_refresh`,
+        in a worker thread so that clients are not held up. The state
+        can then be swapped in at once with `apply_refresh`.
+        :returns: dict of attribute name -> value
+        :raises: ServerError if a refresh is already running
+        """
+        if self.refreshing:
+            raise ServerError('The server is already being refreshed.')
+        self.refreshing = True
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                None, self.read_refresh)
+        finally:
+            self.refreshing = False
+
+    def read_refresh(self):
+        """
+        Read and build everything that is refreshed, without changing
+        the server.
+        :returns: dict of attribute name -> value
+        """
+        state = self.read_config()
+        state.update(self.read_characters())
+        state.update(self.read_iniswaps())
+        state.update(self.read_music())
+        state.update(self.read_backgrounds())
+        state.update(self.read_ipranges())
+
+        # Make sure the commands can be reloaded
+        import server.commands
+        commands_dir = os.path.dirname(server.commands.__file__)
+        for name in sorted(os.listdir(commands_dir)):
+            if name.endswith('.py'):
+                path = os.path.join(commands_dir, name)
+                with open(path, 'r', encoding='utf-8') as source:
+                    compile(source.read(), path, 'exec')
+        return state
+
+    def read_config(self):
+        """
+        Read the parts of config.yaml that can be changed without
+        restarting the server.
+        :returns: dict with the MOTD and the moderator profiles
+        """
+        cfg_yaml = load_yaml('config/config.yaml')
+        if isinstance(cfg_yaml['modpass'], str):
+            cfg_yaml['modpass'] = {'default': {'password': cfg_yaml['modpass']}}
+        return {
+            'motd': cfg_yaml['motd'].replace('\\n', ' \n'),
+            'modpass': cfg_yaml['modpass']
+        }
+
+    def apply_refresh(self, state):
+        """
+        Swap in a state built by `read_refresh`.
+        Everything that can fail is done before the swap, so that the
+        configuration is left unchanged if this raises.
+        :param state: dict of attribute name -> value
+        :returns: list of changes, as from `describe_changes`
+        """
+        changes, char_index = self.prepare_changes(state)
+        database.load_subtype_atoms()
+
+        import server.commands
+        importlib.reload(server.commands)
+        server.commands.reload()
+
+        self.swap_state(state, char_index)
+        self.refreshes += 1
+        # Keep the emote tables parsed so far, should the server crash
+        self.char_emotes.save()
+        return changes
+
+    def apply_changes(self, state):
+        """
+        Swap in a state built by any of the read_* methods.
+        :param state: dict of attribute name -> value
+        :returns: list of changes, as from `describe_changes`
+        """
+        changes, char_index = self.prepare_changes(state)
+        self.swap_state(state, char_index)
+        return changes
+
+    def prepare_changes(self, state):
+        """
+        Do everything that can fail before a state built by the read_*
+        methods is swapped in, without changing the server.
+        :param state: dict of attribute name -> value
+        :returns: tuple (list of changes, as from `describe_changes`,
+            character name index for the new character list or None)
+        """
+        changes = self.describe_changes(state)
+        char_index = None
+        if 'char_list' in state:
+            char_index = self.client_manager.build_char_name_index(
+                state['char_list'])
+        return changes, char_index
+
+    def swap_state(self, state, char_index):
+        """
+        Swap in a state prepared by `prepare_changes`.
+        :param state: dict of attribute name -> value
+        :param char_index: character name index from `prepare_changes`
+        """
+        if 'motd' in state:
+            self.config['motd'] = state.pop('motd')
+
+        # Reload moderator passwords list and unmod any moderator affected by
+        # credential changes or removals
+        if 'modpass' in state:
+            modpass = state.pop('modpass')
             if isinstance(self.config['modpass'], str):
                 self.config['modpass'] = {'default': {'password': self.config['modpass']}}
-            if isinstance(cfg_yaml['modpass'], str):
-                cfg_yaml['modpass'] = {'default': {'password': cfg_yaml['modpass']}}
-
             for profile in self.config['modpass']:
-                if profile not in cfg_yaml['modpass'] or \
-                   self.config['modpass'][profile] != cfg_yaml['modpass'][profile]:
+                if profile not in modpass or \
+                   self.config['modpass'][profile] != modpass[profile]:
                     for client in filter(
                             lambda c: c.mod_profile_name == profile,
                             self.client_manager.clients):
@@ -520,14 +899,49 @@ class TsuServer3:
                         client.send_ooc(
                             'Your moderator credentials have been revoked.')
                         client.send_command('AUTH', '-1')
-            self.config['modpass'] = cfg_yaml['modpass']
+            self.config['modpass'] = modpass
 
-        self.load_characters()
-        self.load_iniswaps()
-        self.load_music()
-        self.load_backgrounds()
-        self.load_ipranges()
+        self.apply_state(state)
+        if char_index is not None:
+            self.client_manager.swap_char_name_index(char_index)
 
-        import server.commands
-        importlib.reload(server.commands)
-        server.commands.reload()
+    def describe_changes(self, state):
+        """
+        Describe how a state built by the read_* methods differs from
+        the current one.
+        :param state: dict of attribute name -> value
+        :returns: list of human-readable changes
+        """
+        def count(name, old, new):
+            old, new = set(old), set(new)
+            added, removed = len(new - old), len(old - new)
+            if added or removed:
+                changes.append(f'{name}: {added} added, {removed} removed')
+
+        changes = []
+        if 'motd' in state and state['motd'] != self.config['motd']:
+            changes.append('MOTD changed')
+        if 'modpass' in state:
+            modpass = self.config['modpass']
+            if isinstance(modpass, str):
+                modpass = {'default': {'password': modpass}}
+            count('Moderator profiles', modpass, state['modpass'])
+            changed = [profile for profile in modpass
+                       if profile in state['modpass'] and
+                       modpass[profile] != state['modpass'][profile]]
+            if changed:
+                changes.append(
+                    f'Moderator profiles changed: {", ".join(changed)}')
+        if 'char_list' in state:
+            count('Characters', self.char_list, state['char_list'])
+        if 'music_index' in state:
+            count('Music', self.music_index, state['music_index'])
+        if 'backgrounds' in state:
+            count('Backgrounds', self.backgrounds, state['backgrounds'])
+        if 'allowed_iniswaps' in state and \
+                state['allowed_iniswaps'] != self.allowed_iniswaps:
+            changes.append('INI swap list changed')
+        if 'ipRange_bans' in state:
+            count('IP range bans', self.ipRange_bans.entries,
+                  state['ipRange_bans'].entries)
+        return changes
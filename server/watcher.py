@@ -0,0 +1,73 @@
+# tsuserver3, an Attorney Online server
+#
+# Copyright (C) 2016 argoneus <argoneuscze@gmail.com>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+from glob import glob
+
+
+class FileWatcher:
+    """Finds files that were created, modified or deleted, by polling
+    their modification time and size.
+
+    Files are watched by glob pattern. `scan` only stats files, so that
+    it can run in a worker thread, while `changes` compares a scan with
+    the previous one.
+    """
+
+    def __init__(self, patterns):
+        """
+        :param patterns: glob patterns of the files to watch
+
+        """
+        self.patterns = list(patterns)
+        # Pattern -> {path: (mtime_ns, size)}
+        self.stamps = self.scan()
+
+    def scan(self) -> dict:
+        """Stat every watched file.
+
+        :returns: dict of pattern -> {path: (mtime_ns, size)}
+
+        """
+        stamps = {}
+        for pattern in self.patterns:
+            files = stamps[pattern] = {}
+            for path in glob(pattern):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+        return stamps
+
+    def changes(self, stamps) -> dict:
+        """Compare a scan with the previous one, and remember it.
+
+        :param stamps: result of `scan`
+        :returns: dict of pattern -> set of changed paths, only for
+            patterns with changes
+
+        """
+        changes = {}
+        for pattern, files in stamps.items():
+            old_files = self.stamps.get(pattern, {})
+            changed = {path for path in files.keys() | old_files.keys()
+                       if files.get(path) != old_files.get(path)}
+            if changed:
+                changes[pattern] = changed
+        self.stamps = stamps
+        return changes